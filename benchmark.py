@@ -0,0 +1,236 @@
+"""Benchmark del pipeline de datos del dashboard sobre datasets simulados de distintos tamaños.
+
+Ejecuta sin Streamlit las etapas que recorre cada rerun (generación de datos, lectura de CSV,
+índices y filtros, cubo mensual, filtros cruzados, rollups temporales y sus analíticas,
+gráficos y resumen por categoría) y registra por etapa el tiempo, la memoria pico y el tamaño
+del resultado (JSON de las figuras, memoria de los DataFrames). Antes de medir cada tamaño
+comprueba que los rollups temporales coinciden con agrupar las filas.
+
+Uso:
+    python benchmark.py --tamaños 1000 100000 1000000 --salida benchmark_resultados.json
+    python benchmark.py --comparar benchmark_anterior.json --tolerancia 0.25
+"""
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+
+from datos_financieros import (
+    CuboMensual,
+    IndiceFiltros,
+    NIVELES_TEMPORALES,
+    RollupsTemporales,
+    agregar_filtrados,
+    agrupar_por_nivel,
+    analizar_serie,
+    generar_datos_simulados,
+    nivel_temporal_automatico,
+    resumen_por_categoria,
+)
+from graficos import crear_grafico_barras_categorias, crear_grafico_lineas
+from ingesta_datos import memoria_estructura, procesar_archivo_csv
+
+TAMAÑOS_PREDETERMINADOS = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+MAX_FILAS_CSV = 1_000_000  # Por encima, generar el CSV de prueba tarda más que la propia lectura
+DIAS_SIMULADOS = 366  # Datos diarios de 2024
+
+class ArchivoEnMemoria(io.BytesIO):
+    """BytesIO con el atributo `size` de los archivos subidos a Streamlit"""
+
+    def __init__(self, contenido):
+        super().__init__(contenido)
+        self.size = len(contenido)
+
+def estimar_bytes(objeto):
+    """Memoria aproximada de un resultado: JSON de las figuras o DataFrames, arrays y objetos que los contienen"""
+    if isinstance(objeto, go.Figure):
+        return len(objeto.to_json().encode())
+    return memoria_estructura(objeto)
+
+def medir(funcion, repeticiones=1, memoria=True):
+    """Ejecuta `funcion` y devuelve (resultado, segundos, memoria pico en bytes).
+
+    El tiempo es el mínimo de `repeticiones` ejecuciones sin trazar memoria; la memoria pico se
+    mide en una ejecución aparte con tracemalloc (incluye los arrays de NumPy).
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        try:
+            resultado = funcion()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return resultado, min(tiempos), pico
+
+def verificar_rollups(df, filas_maximas=100_000, semilla=0):
+    """Comprueba que la serie de cada nivel de los rollups coincide con agrupar las filas.
+
+    Deja sin valor parte de las dimensiones (como al conciliar archivos con esquemas distintos)
+    para cubrir las celdas con faltantes. Lanza AssertionError con el nivel que no coincide.
+    """
+    muestra = df.iloc[:filas_maximas].copy()
+    generador = np.random.default_rng(semilla)
+    for col in ['Region', 'Departamento']:
+        if col in muestra.columns:
+            muestra.loc[generador.random(len(muestra)) < 0.1, col] = np.nan
+    rollups = RollupsTemporales(muestra)
+    for nivel in NIVELES_TEMPORALES:
+        esperado = agrupar_por_nivel(muestra, nivel)
+        serie = rollups.serie(nivel)
+        assert np.allclose(serie[['Ingresos', 'Egresos']], esperado[['Ingresos', 'Egresos']]) \
+            and (serie['Fecha'] == esperado['Fecha']).all(), f"Rollups distintos de las filas en el nivel {nivel}"
+
+def ejecutar_tamaño(filas, repeticiones=1, memoria=True, max_filas_csv=MAX_FILAS_CSV):
+    """Mide todas las etapas del pipeline para un dataset de `filas` registros"""
+    resultados = []
+
+    def registrar(etapa, funcion, filas_entrada):
+        resultado, segundos, pico = medir(funcion, repeticiones, memoria)
+        resultados.append({
+            'filas': filas,
+            'etapa': etapa,
+            'filas_entrada': int(filas_entrada),
+            'segundos': round(segundos, 6),
+            'memoria_pico_bytes': pico,
+            'payload_bytes': estimar_bytes(resultado),
+        })
+        print(f"{filas:>12,} {etapa:<22} {segundos:>10.4f} s "
+              f"{(pico or 0) / 1024 ** 2:>10.1f} MB {resultados[-1]['payload_bytes'] / 1024:>12.1f} KB")
+        return resultado
+
+    filas_por_periodo = max(1, -(-filas // DIAS_SIMULADOS))
+    df = registrar(
+        'generar_datos',
+        lambda: generar_datos_simulados(filas_por_periodo=filas_por_periodo, frecuencia='D', semilla=0).iloc[:filas],
+        filas
+    )
+    verificar_rollups(df)
+
+    if filas <= max_filas_csv:
+        archivo = ArchivoEnMemoria(df.to_csv(index=False).encode())
+
+        def leer_csv(**opciones):
+            archivo.seek(0)
+            resultado, error = procesar_archivo_csv(archivo, **opciones)
+            if error:
+                raise RuntimeError(error)
+            return resultado
+
+        registrar('procesar_csv', leer_csv, filas)
+        registrar('procesar_csv_bloques', lambda: leer_csv(por_bloques=True), filas)
+
+    categorias = list(df['Categoria'].cat.categories[:3])
+    filtros = dict(
+        rango_fechas=(pd.Timestamp('2024-02-01'), pd.Timestamp('2024-11-30')),
+        monto_minimo=3000,
+        regiones=[df['Region'].cat.categories[0]],
+        categorias=categorias,
+    )
+
+    indice = registrar('indice_filtros', lambda: IndiceFiltros(df), filas)
+    df_filtrado = registrar('filtrar', lambda: df.take(indice.filtrar(**filtros)), filas)
+    cubo = registrar('cubo_mensual', lambda: CuboMensual(df), filas)
+    filtros_cubo = dict(filtros, rango_fechas=None, monto_minimo=None)
+    registrar('seleccionar_cubo', lambda: cubo.resumen_categoria(cubo.seleccionar(**filtros_cubo)), len(cubo.celdas))
+    rollups = registrar('rollups_temporales', lambda: RollupsTemporales(df), filas)
+    filtros_rollups = dict(filtros, monto_minimo=None)
+    nivel = nivel_temporal_automatico(rollups.dias, 600, filtros['rango_fechas'])
+    # Filtro cruzado: un tramo de días seleccionado en el gráfico y una categoría elegida en las barras
+    filtros_cruzados = dict(filtros, rango_fechas=(pd.Timestamp('2024-03-11'), pd.Timestamp('2024-04-21')),
+                            monto_minimo=None, categorias=categorias[:1])
+    registrar(
+        'seleccion_cruzada',
+        lambda: (df.take(indice.filtrar(**filtros_cruzados)),
+                 agregar_filtrados(cubo, filtros_cruzados, None, rollups.cubo_diario)),
+        filas
+    )
+    serie = registrar('serie_rollups', lambda: rollups.serie(nivel, **filtros_rollups), len(rollups.diario))
+    registrar('analizar_serie', lambda: analizar_serie(serie, nivel, ventana=7), len(serie))
+
+    registrar(
+        'grafico_lineas',
+        lambda: crear_grafico_lineas(df_filtrado, 'Claro', categorias, puntos_maximos=600),
+        len(df_filtrado)
+    )
+    registrar('grafico_barras', lambda: crear_grafico_barras_categorias(df_filtrado, 'Claro', categorias), len(df_filtrado))
+    registrar('resumen_categoria', lambda: resumen_por_categoria(df_filtrado), len(df_filtrado))
+    return resultados
+
+def comparar_reportes(actual, anterior, tolerancia):
+    """Etapas cuyo tiempo empeoró más que `tolerancia` (fracción) respecto al reporte anterior"""
+    tiempos_anteriores = {(r['filas'], r['etapa']): r['segundos'] for r in anterior['resultados']}
+    regresiones = []
+    for resultado in actual['resultados']:
+        previo = tiempos_anteriores.get((resultado['filas'], resultado['etapa']))
+        if previo and resultado['segundos'] > previo * (1 + tolerancia):
+            regresiones.append(
+                f"{resultado['etapa']} con {resultado['filas']:,} filas: "
+                f"{previo:.4f} s -> {resultado['segundos']:.4f} s"
+            )
+    return regresiones
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de datos del dashboard")
+    parser.add_argument('--tamaños', type=int, nargs='+', default=TAMAÑOS_PREDETERMINADOS,
+                        help="Cantidades de filas de los datasets simulados")
+    parser.add_argument('--repeticiones', type=int, default=1,
+                        help="Ejecuciones por etapa; se reporta el tiempo mínimo")
+    parser.add_argument('--sin-memoria', action='store_true',
+                        help="No medir la memoria pico (evita la ejecución extra con tracemalloc)")
+    parser.add_argument('--max-filas-csv', type=int, default=MAX_FILAS_CSV,
+                        help="Tamaño máximo para el que se mide la lectura de CSV")
+    parser.add_argument('--salida', default='benchmark_resultados.json',
+                        help="Archivo JSON donde se escribe el reporte")
+    parser.add_argument('--comparar', help="Reporte anterior contra el que buscar regresiones de tiempo")
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="Empeoramiento relativo tolerado al comparar (0.25 = 25 %%)")
+    args = parser.parse_args(argumentos)
+
+    print(f"{'filas':>12} {'etapa':<22} {'tiempo':>12} {'memoria pico':>13} {'payload':>15}")
+    resultados = []
+    for filas in args.tamaños:
+        resultados += ejecutar_tamaño(filas, args.repeticiones, not args.sin_memoria, args.max_filas_csv)
+
+    reporte = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plotly': plotly.__version__,
+        },
+        'repeticiones': args.repeticiones,
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+    print(f"Reporte guardado en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar_reportes(reporte, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"⚠️ Regresión: {regresion}")
+        if regresiones:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
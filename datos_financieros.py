@@ -0,0 +1,645 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# --------------------
+# DATOS FINANCIEROS
+# --------------------
+# Generación de datos simulados, índices de filtrado, cubo de agregados mensuales y agregados
+# por nivel temporal. Sin dependencias de Streamlit: los usan el dashboard y el benchmark del pipeline.
+
+CATEGORIAS_BASE = ['Ventas', 'Servicios', 'Consultoría', 'Productos']
+DEPARTAMENTOS_BASE = ['Marketing', 'Operaciones', 'RRHH', 'IT', 'Administración']
+REGIONES_BASE = ['Norte', 'Sur', 'Centro', 'Oriente']
+
+# Granularidades disponibles para los datos simulados (alias de frecuencia de pandas)
+FRECUENCIAS_SIMULACION = {'Mensual': 'ME', 'Semanal': 'W', 'Diaria': 'D'}
+
+# Filtros de dimensión: nombre del filtro -> columna
+FILTROS_DIMENSION = {'categorias': 'Categoria', 'regiones': 'Region', 'departamentos': 'Departamento'}
+
+def completar_nombres(base, cantidad, prefijo):
+    """Completa la lista base con nombres genéricos hasta la cantidad pedida"""
+    return base[:cantidad] + [f"{prefijo} {i}" for i in range(len(base) + 1, cantidad + 1)]
+
+def fechas_simuladas(meses=12, año=2024, frecuencia='ME'):
+    """Fechas de los períodos que genera generar_datos_simulados"""
+    inicio = pd.Timestamp(year=año, month=1, day=1)
+    fin = inicio + pd.DateOffset(months=meses) - pd.Timedelta(days=1)
+    return pd.date_range(start=inicio, end=fin, freq=frecuencia)
+
+def generar_datos_simulados(meses=12, año=2024, filas_por_periodo=None, num_categorias=4,
+                            num_departamentos=5, num_regiones=4, frecuencia='ME', semilla=None):
+    """Genera un DataFrame con datos financieros ficticios de forma vectorizada.
+
+    Cada período de `frecuencia` recibe `filas_por_periodo` registros (por defecto uno por
+    categoría) y cada columna se genera con una sola extracción del generador, por lo que
+    la misma `semilla` reproduce los mismos datos.
+    """
+    rng = np.random.default_rng(semilla)
+    fechas = fechas_simuladas(meses, año, frecuencia)
+
+    filas_por_periodo = filas_por_periodo or num_categorias
+    n = len(fechas) * filas_por_periodo
+
+    categorias = completar_nombres(CATEGORIAS_BASE, num_categorias, 'Categoría')
+    departamentos = completar_nombres(DEPARTAMENTOS_BASE, num_departamentos, 'Departamento')
+    regiones = completar_nombres(REGIONES_BASE, num_regiones, 'Región')
+
+    ingresos = rng.integers(2000, 8000, n, dtype=np.int32)
+    egresos = rng.integers(1000, 6000, n, dtype=np.int32)
+
+    return pd.DataFrame({
+        'Fecha': np.repeat(fechas.values, filas_por_periodo),
+        'Categoria': pd.Categorical.from_codes(np.arange(n, dtype=np.int32) % num_categorias, categorias),
+        'Departamento': pd.Categorical.from_codes(rng.integers(0, num_departamentos, n), departamentos),
+        'Ingresos': ingresos,
+        'Egresos': egresos,
+        'Utilidad': ingresos - egresos,
+        'Region': pd.Categorical.from_codes(rng.integers(0, num_regiones, n), regiones),
+    })
+
+class IndiceFiltros:
+    """Índices de un dataset para resolver los filtros del sidebar sin copiar el DataFrame.
+
+    Se construyen una sola vez por dataset: posiciones ordenadas por fecha (rangos por búsqueda
+    binaria), Ingresos ordenados para el umbral de monto mínimo y las dimensiones codificadas como
+    enteros. Los códigos de varias dimensiones se combinan en una sola clave por fila (base mixta),
+    así que todas las selecciones de dimensiones se evalúan juntas con una tabla de combinaciones
+    permitidas y un único recorrido de las filas, sin importar cuántos filtros haya activos.
+    """
+    COLUMNAS_DIMENSION = list(FILTROS_DIMENSION.values())
+    MAX_COMBINACIONES = 1 << 24  # Tamaño máximo de la tabla de combinaciones de un grupo de dimensiones
+
+    def __init__(self, df):
+        self.num_filas = len(df)
+
+        self.orden_fechas = None
+        if 'Fecha' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+            fechas = df['Fecha'].to_numpy(dtype='datetime64[ns]')
+            self.orden_fechas = np.argsort(fechas, kind='stable')
+            self.fechas_ordenadas = fechas[self.orden_fechas]
+
+        self.orden_ingresos = None
+        if 'Ingresos' in df.columns:
+            ingresos = df['Ingresos'].to_numpy(dtype='float64', na_value=np.nan)
+            self.orden_ingresos = np.argsort(ingresos, kind='stable')
+            self.ingresos_ordenados = ingresos[self.orden_ingresos]
+            # Los NaN quedan al final del orden y nunca cumplen el umbral
+            self.ingresos_validos = self.num_filas - int(np.isnan(ingresos).sum())
+
+        self._codificar_dimensiones(df)
+
+    def _codificar_dimensiones(self, df):
+        """Valores de cada dimensión y claves combinadas por grupo de dimensiones.
+
+        Cada dimensión reserva el último código para los valores faltantes. Las dimensiones se
+        agrupan mientras el producto de sus cardinalidades no supere MAX_COMBINACIONES.
+        """
+        self.valores = {}
+        self.con_faltantes = {}
+        self.grupos = []  # [(columnas, cardinalidades, claves por fila)]
+        columnas, cardinalidades, claves = [], [], None
+        for col in self.COLUMNAS_DIMENSION:
+            if col not in df.columns:
+                continue
+            codigos, valores = pd.factorize(df[col])
+            self.valores[col] = pd.Index(valores)
+            self.con_faltantes[col] = bool((codigos < 0).any())
+            cardinalidad = len(valores) + 1
+            codigos = np.where(codigos < 0, len(valores), codigos)
+            if columnas and np.prod(cardinalidades) * cardinalidad > self.MAX_COMBINACIONES:
+                self.grupos.append((columnas, cardinalidades, claves))
+                columnas, cardinalidades, claves = [], [], None
+            claves = codigos if claves is None else claves * cardinalidad + codigos
+            columnas.append(col)
+            cardinalidades.append(cardinalidad)
+        if columnas:
+            self.grupos.append((columnas, cardinalidades, claves))
+        self.grupos = [
+            (columnas, cardinalidades, claves.astype(np.min_scalar_type(int(np.prod(cardinalidades)) - 1)))
+            for columnas, cardinalidades, claves in self.grupos
+        ]
+
+    def _permitidos(self, col, seleccion):
+        """Códigos de `col` incluidos en la selección, o None si la selección los incluye todos"""
+        valores = self.valores[col]
+        permitidos = np.zeros(len(valores) + 1, dtype=bool)
+        seleccion = list(seleccion)
+        codigos = valores.get_indexer([valor for valor in seleccion if not pd.isna(valor)])
+        permitidos[codigos[codigos >= 0]] = True
+        permitidos[-1] = any(pd.isna(valor) for valor in seleccion)
+        if permitidos[:-1].all() and (permitidos[-1] or not self.con_faltantes[col]):
+            return None
+        return permitidos
+
+    def filtrar(self, rango_fechas=None, monto_minimo=None, **selecciones):
+        """Devuelve las posiciones (en orden original) de las filas que cumplen todos los filtros.
+
+        Los filtros en None no se aplican; el rango de fechas incluye ambos extremos (días completos).
+        Las selecciones de dimensiones se pasan por su nombre en FILTROS_DIMENSION (p. ej. `regiones`).
+        """
+        mascara = None
+        permitidos = {
+            FILTROS_DIMENSION[nombre]: self._permitidos(FILTROS_DIMENSION[nombre], seleccion)
+            for nombre, seleccion in selecciones.items()
+            if seleccion is not None and FILTROS_DIMENSION[nombre] in self.valores
+        }
+        for columnas, cardinalidades, claves in self.grupos:
+            if all(permitidos.get(col) is None for col in columnas):
+                continue
+            # Tabla de combinaciones permitidas: producto exterior de los códigos de cada dimensión
+            tabla = np.ones(cardinalidades, dtype=bool)
+            for eje, col in enumerate(columnas):
+                if permitidos.get(col) is not None:
+                    forma = [1] * len(columnas)
+                    forma[eje] = cardinalidades[eje]
+                    tabla &= permitidos[col].reshape(forma)
+            seleccion_grupo = tabla.ravel()[claves]
+            mascara = seleccion_grupo if mascara is None else np.logical_and(mascara, seleccion_grupo, out=mascara)
+
+        if rango_fechas is not None and self.orden_fechas is not None:
+            inicio = np.datetime64(pd.Timestamp(rango_fechas[0]), 'ns')
+            fin = np.datetime64(pd.Timestamp(rango_fechas[1]) + pd.Timedelta(days=1), 'ns')
+            i, j = np.searchsorted(self.fechas_ordenadas, [inicio, fin], side='left')
+            if i > 0 or j < self.num_filas:
+                mascara = self._excluir(mascara, self.orden_fechas[:i], self.orden_fechas[j:])
+
+        if monto_minimo is not None and self.orden_ingresos is not None:
+            validos = self.ingresos_validos
+            k = np.searchsorted(self.ingresos_ordenados[:validos], monto_minimo, side='left')
+            if k > 0 or validos < self.num_filas:
+                mascara = self._excluir(mascara, self.orden_ingresos[:k], self.orden_ingresos[validos:])
+
+        if mascara is None:
+            return np.arange(self.num_filas)
+        return np.flatnonzero(mascara)
+
+    def _excluir(self, mascara, *posiciones):
+        """Desactiva en la máscara (creándola si hace falta) las filas de cada arreglo de posiciones"""
+        if mascara is None:
+            mascara = np.ones(self.num_filas, dtype=bool)
+        for excluidas in posiciones:
+            mascara[excluidas] = False
+        return mascara
+
+    def anexar(self, df, conservadas=None):
+        """Índice de `df` = filas `conservadas` de este dataset (None si son todas) + filas nuevas al final.
+
+        Reutiliza los órdenes existentes: solo se ordenan las filas nuevas y se mezclan con las
+        anteriores. Si las columnas indexadas cambiaron, el índice se reconstruye.
+        """
+        num_base = self.num_filas if conservadas is None else int(conservadas.sum())
+        nuevo = IndiceFiltros(df.iloc[num_base:])
+        if ((nuevo.orden_fechas is None) != (self.orden_fechas is None)
+                or (nuevo.orden_ingresos is None) != (self.orden_ingresos is None)
+                or set(self.valores) != {col for col in self.COLUMNAS_DIMENSION if col in df.columns}):
+            return IndiceFiltros(df)
+
+        # Posición de cada fila conservada en el dataset resultante
+        mapa = None if conservadas is None else np.cumsum(conservadas) - 1
+
+        def mezclar(orden_base, valores_base, orden_nuevo, valores_nuevo):
+            # Dos tramos ya ordenados: el sort estable (timsort) los mezcla en tiempo lineal
+            if mapa is not None:
+                mantener = conservadas[orden_base]
+                orden_base, valores_base = mapa[orden_base[mantener]], valores_base[mantener]
+            orden = np.concatenate([orden_base, orden_nuevo + num_base])
+            valores = np.concatenate([valores_base, valores_nuevo])
+            permutacion = np.argsort(valores, kind='stable')
+            return orden[permutacion], valores[permutacion]
+
+        indice = copy.copy(self)
+        indice.num_filas = num_base + nuevo.num_filas
+        if self.orden_fechas is not None:
+            indice.orden_fechas, indice.fechas_ordenadas = mezclar(
+                self.orden_fechas, self.fechas_ordenadas, nuevo.orden_fechas, nuevo.fechas_ordenadas
+            )
+        if self.orden_ingresos is not None:
+            indice.orden_ingresos, indice.ingresos_ordenados = mezclar(
+                self.orden_ingresos, self.ingresos_ordenados, nuevo.orden_ingresos, nuevo.ingresos_ordenados
+            )
+            indice.ingresos_validos = indice.num_filas - int(np.isnan(indice.ingresos_ordenados).sum())
+
+        # Codificar las dimensiones es lineal (sin ordenar): se recalculan para el dataset completo
+        indice._codificar_dimensiones(df)
+        return indice
+
+# Dimensiones y medidas del cubo de agregados
+def en_periodos(meses, periodos):
+    """Máscara de los `meses` (datetime64[M]) incluidos en `periodos`, donde NaT cubre las fechas faltantes"""
+    mascara = np.isin(meses, periodos[~np.isnat(periodos)])
+    if np.isnat(periodos).any():
+        mascara |= np.isnat(meses)
+    return mascara
+
+def mascara_selecciones(celdas, dimensiones, selecciones):
+    """Máscara de las celdas cuyas dimensiones están en las selecciones (nombres de FILTROS_DIMENSION)"""
+    mascara = np.ones(len(celdas), dtype=bool)
+    for nombre, seleccion in selecciones.items():
+        if seleccion is not None and FILTROS_DIMENSION[nombre] in dimensiones:
+            mascara &= celdas[FILTROS_DIMENSION[nombre]].isin(seleccion).to_numpy()
+    return mascara
+
+DIMENSIONES_CUBO = ['Categoria', 'Region', 'Departamento']
+MEDIDAS_CUBO = ['Ingresos', 'Egresos', 'Utilidad']
+
+class CuboMensual:
+    """Sumas y conteos parciales por (mes × Categoria × Region × Departamento), calculados al cargar.
+
+    Métricas, gráficos y resumen por categoría se responden agregando celdas del cubo siempre que
+    los filtros activos abarquen celdas completas. Si un filtro parte una celda (un rango de fechas
+    que corta un mes o un monto mínimo mayor que algún ingreso de la celda), `seleccionar`
+    devuelve None y el llamador debe agregar sobre las filas filtradas.
+    """
+
+    columna_periodo = 'Periodo'
+
+    def __init__(self, df):
+        self.dimensiones = [col for col in DIMENSIONES_CUBO if col in df.columns]
+        self.medidas = [col for col in MEDIDAS_CUBO if col in df.columns]
+        self.celdas = self._agregar_celdas(df)
+        self._calcular_fecha_unica()
+
+    @classmethod
+    def desde_celdas(cls, celdas, dimensiones, medidas, columna_periodo):
+        """Cubo sobre celdas ya agregadas con las mismas columnas (p. ej. las diarias de RollupsTemporales)"""
+        cubo = cls.__new__(cls)
+        cubo.dimensiones, cubo.medidas, cubo.celdas = dimensiones, medidas, celdas
+        cubo.columna_periodo = columna_periodo
+        cubo._calcular_fecha_unica()
+        return cubo
+
+    def _agregar_celdas(self, df):
+        """Celdas del cubo para las filas de `df`"""
+        agregaciones = {
+            'Fecha_min': ('Fecha', 'min'),
+            'Fecha_max': ('Fecha', 'max'),
+            'Registros': ('Fecha', 'size'),
+        }
+        for medida in self.medidas:
+            agregaciones[f'{medida}_suma'] = (medida, 'sum')
+            agregaciones[f'{medida}_n'] = (medida, 'count')
+        if 'Ingresos' in self.medidas:
+            agregaciones['Ingresos_min'] = ('Ingresos', 'min')
+
+        periodo = df['Fecha'].dt.to_period('M').rename('Periodo')
+        return df.groupby(
+            [periodo] + self.dimensiones, observed=True, dropna=False
+        ).agg(**agregaciones).reset_index()
+
+    def _calcular_fecha_unica(self):
+        """La serie temporal solo se puede reconstruir si cada mes tiene una única fecha"""
+        fechas_periodo = self.celdas.groupby(self.columna_periodo, dropna=False).agg(
+            minima=('Fecha_min', 'min'), maxima=('Fecha_max', 'max')
+        )
+        self.fecha_unica_por_periodo = bool((fechas_periodo['minima'] == fechas_periodo['maxima']).all())
+
+    def actualizar(self, df, periodos):
+        """Cubo de `df` recalculando solo las celdas de los meses `periodos` (datetime64[M]).
+
+        Las celdas de los demás meses se conservan tal cual; sirve cuando `df` difiere del dataset
+        original solo en filas de esos meses (p. ej. al anexar un mes nuevo).
+        """
+        if ([col for col in DIMENSIONES_CUBO if col in df.columns] != self.dimensiones
+                or [col for col in MEDIDAS_CUBO if col in df.columns] != self.medidas):
+            return CuboMensual(df)
+
+        meses_filas = df['Fecha'].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+        meses_celdas = self.celdas['Periodo'].dt.start_time.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+        cubo = copy.copy(self)
+        cubo.celdas = pd.concat(
+            [self.celdas[~en_periodos(meses_celdas, periodos)], self._agregar_celdas(df[en_periodos(meses_filas, periodos)])],
+            ignore_index=True
+        )
+        # Las dimensiones conservan el tipo (y orden de categorías) del dataset completo
+        for col in self.dimensiones:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                cubo.celdas[col] = cubo.celdas[col].astype('category').cat.set_categories(df[col].cat.categories)
+        cubo._calcular_fecha_unica()
+        return cubo
+
+    def seleccionar(self, rango_fechas=None, monto_minimo=None, **selecciones):
+        """Celdas que cumplen los filtros, o None si algún filtro no coincide con celdas completas"""
+        celdas = self.celdas
+        mascara = mascara_selecciones(celdas, self.dimensiones, selecciones)
+
+        if rango_fechas is not None:
+            inicio = pd.Timestamp(rango_fechas[0])
+            fin = pd.Timestamp(rango_fechas[1]) + pd.Timedelta(days=1)
+            dentro = (celdas['Fecha_min'] >= inicio) & (celdas['Fecha_max'] < fin)
+            fuera = (celdas['Fecha_max'] < inicio) | (celdas['Fecha_min'] >= fin) | celdas['Fecha_min'].isna()
+            if not (dentro | fuera).all():
+                return None
+            mascara &= dentro.to_numpy()
+
+        seleccion = celdas[mascara]
+        if monto_minimo is not None and 'Ingresos' in self.medidas:
+            parte_celdas = (seleccion['Ingresos_min'] < monto_minimo) | (seleccion['Ingresos_n'] < seleccion['Registros'])
+            if parte_celdas.any():
+                return None
+        return seleccion
+
+    def totales(self, celdas):
+        """Totales de las medidas y número de registros de las celdas"""
+        totales = {medida: celdas[f'{medida}_suma'].sum() for medida in self.medidas}
+        totales['Registros'] = int(celdas['Registros'].sum())
+        return totales
+
+    def serie_temporal(self, celdas):
+        """Ingresos y Egresos por fecha, o None si algún mes tiene varias fechas distintas"""
+        if not self.fecha_unica_por_periodo:
+            return None
+        serie = celdas.groupby(self.columna_periodo).agg(
+            Fecha=('Fecha_min', 'min'),
+            Ingresos=('Ingresos_suma', 'sum'),
+            Egresos=('Egresos_suma', 'sum')
+        )
+        return serie.sort_values('Fecha').reset_index(drop=True)
+
+    def utilidad_por_categoria(self, celdas):
+        """Utilidad total por categoría"""
+        return celdas.groupby('Categoria', observed=True).agg(
+            Utilidad=('Utilidad_suma', 'sum')
+        ).reset_index()
+
+    def resumen_categoria(self, celdas):
+        """Resumen por categoría con la misma forma que el groupby sobre las filas"""
+        sumas = celdas.groupby('Categoria', observed=True)[
+            [f'{medida}_{parte}' for medida in self.medidas for parte in ('suma', 'n')]
+        ].sum()
+        resumen = pd.DataFrame({
+            ('Ingresos', 'sum'): sumas['Ingresos_suma'],
+            ('Ingresos', 'mean'): sumas['Ingresos_suma'] / sumas['Ingresos_n'],
+            ('Ingresos', 'count'): sumas['Ingresos_n'],
+            ('Egresos', 'sum'): sumas['Egresos_suma'],
+            ('Egresos', 'mean'): sumas['Egresos_suma'] / sumas['Egresos_n'],
+            ('Utilidad', 'sum'): sumas['Utilidad_suma'],
+            ('Utilidad', 'mean'): sumas['Utilidad_suma'] / sumas['Utilidad_n'],
+        })
+        return resumen.round(2)
+
+# Niveles del gráfico de tendencia, de más fino a más grueso (alias de periodo de pandas)
+NIVELES_TEMPORALES = {'Día': 'D', 'Semana': 'W', 'Mes': 'M', 'Trimestre': 'Q', 'Año': 'Y'}
+
+class RollupsTemporales:
+    """Sumas de Ingresos y Egresos por (periodo × dimensiones) en cada nivel de NIVELES_TEMPORALES.
+
+    El nivel diario se agrupa sobre las filas al cargar y los demás se obtienen agregando los días.
+    La serie de un nivel sale de sus celdas si el rango de fechas no corta ningún periodo; si lo
+    corta, se reagrupan los días del rango. Si un monto mínimo deja fuera filas de alguna celda,
+    `serie` devuelve None y el llamador debe agrupar las filas filtradas (ver agrupar_por_nivel).
+
+    Las celdas diarias tienen las mismas columnas que las del cubo mensual, así que `cubo_diario`
+    responde métricas y resúmenes de rangos que cortan meses sin volver a agrupar las filas.
+    """
+
+    def __init__(self, df):
+        self.dimensiones = [col for col in DIMENSIONES_CUBO if col in df.columns]
+        self.medidas = [col for col in MEDIDAS_CUBO if col in df.columns]
+        self.diario = self._agregar_dias(df)
+        self._construir_niveles()
+
+    def _agregar_dias(self, df):
+        """Celdas diarias para las filas de `df` (las filas sin fecha no tienen periodo).
+
+        Como en el cubo, las dimensiones faltantes forman sus propias celdas para no perder filas.
+        """
+        agregaciones = {
+            'Fecha_min': ('Fecha', 'min'),
+            'Fecha_max': ('Fecha', 'max'),
+            'Registros': ('Fecha', 'size'),
+            'Ingresos_min': ('Ingresos', 'min'),
+        }
+        for medida in self.medidas:
+            agregaciones[f'{medida}_suma'] = (medida, 'sum')
+            agregaciones[f'{medida}_n'] = (medida, 'count')
+
+        dia = df['Fecha'].dt.floor('D').rename('Dia')
+        diario = df.groupby([dia] + self.dimensiones, observed=True, dropna=False).agg(**agregaciones).reset_index()
+        return diario[diario['Dia'].notna()].reset_index(drop=True)
+
+    def _agrupar_dias(self, dias, frecuencia, columnas):
+        """Agrega celdas diarias por el inicio de su periodo en `frecuencia`"""
+        inicio = dias['Dia'].dt.to_period(frecuencia).dt.start_time.rename('Fecha')
+        return dias.groupby([inicio] + columnas, observed=True, dropna=False).agg(
+            Dia_min=('Dia', 'min'),
+            Dia_max=('Dia', 'max'),
+            Ingresos_suma=('Ingresos_suma', 'sum'),
+            Egresos_suma=('Egresos_suma', 'sum'),
+            Ingresos_min=('Ingresos_min', 'min'),
+            Ingresos_n=('Ingresos_n', 'sum'),
+            Registros=('Registros', 'sum'),
+        ).reset_index()
+
+    def _construir_niveles(self):
+        self.niveles = {
+            nivel: self._agrupar_dias(self.diario, frecuencia, self.dimensiones)
+            for nivel, frecuencia in NIVELES_TEMPORALES.items()
+        }
+        self.dias = np.sort(self.diario['Dia'].unique())
+        self.cubo_diario = CuboMensual.desde_celdas(self.diario, self.dimensiones, self.medidas, 'Dia')
+
+    def actualizar(self, df, periodos):
+        """Rollups de `df` reagrupando solo los días de los meses `periodos` (ver CuboMensual.actualizar)"""
+        if ([col for col in DIMENSIONES_CUBO if col in df.columns] != self.dimensiones
+                or [col for col in MEDIDAS_CUBO if col in df.columns] != self.medidas):
+            return RollupsTemporales(df)
+
+        meses_filas = df['Fecha'].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+        meses_dias = self.diario['Dia'].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+        rollups = copy.copy(self)
+        rollups.diario = pd.concat(
+            [self.diario[~en_periodos(meses_dias, periodos)], self._agregar_dias(df[en_periodos(meses_filas, periodos)])],
+            ignore_index=True
+        )
+        for col in self.dimensiones:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                rollups.diario[col] = rollups.diario[col].astype('category').cat.set_categories(df[col].cat.categories)
+        rollups._construir_niveles()
+        return rollups
+
+    def serie(self, nivel, rango_fechas=None, monto_minimo=None, **selecciones):
+        """Ingresos y Egresos por inicio de periodo del `nivel`, o None si el monto mínimo parte celdas"""
+        celdas = self.niveles[nivel]
+        mascara = mascara_selecciones(celdas, self.dimensiones, selecciones)
+
+        if rango_fechas is not None:
+            inicio = pd.Timestamp(rango_fechas[0])
+            fin = pd.Timestamp(rango_fechas[1]) + pd.Timedelta(days=1)
+            dentro = ((celdas['Dia_min'] >= inicio) & (celdas['Dia_max'] < fin)).to_numpy()
+            fuera = ((celdas['Dia_max'] < inicio) | (celdas['Dia_min'] >= fin)).to_numpy()
+            if (dentro | fuera)[mascara].all():
+                mascara &= dentro
+            else:
+                # El rango corta algún periodo: se reagrupan solo los días que abarca
+                dias = self.diario
+                en_rango = ((dias['Dia'] >= inicio) & (dias['Dia'] < fin)).to_numpy() \
+                    & mascara_selecciones(dias, self.dimensiones, selecciones)
+                celdas = self._agrupar_dias(dias[en_rango], NIVELES_TEMPORALES[nivel], [])
+                mascara = np.ones(len(celdas), dtype=bool)
+
+        seleccion = celdas[mascara]
+        if monto_minimo is not None:
+            parte_celdas = (seleccion['Ingresos_min'] < monto_minimo) | (seleccion['Ingresos_n'] < seleccion['Registros'])
+            if parte_celdas.any():
+                return None
+        return seleccion.groupby('Fecha').agg(
+            Ingresos=('Ingresos_suma', 'sum'),
+            Egresos=('Egresos_suma', 'sum')
+        ).reset_index()
+
+def agrupar_por_nivel(df, nivel):
+    """Ingresos y Egresos de las filas sumados por inicio de periodo del `nivel`"""
+    inicio = df['Fecha'].dt.to_period(NIVELES_TEMPORALES[nivel]).dt.start_time.rename('Fecha')
+    return df.groupby(inicio)[['Ingresos', 'Egresos']].sum().reset_index()
+
+def ajustar_a_periodos(inicio, fin, nivel):
+    """Rango (inicio, fin) que cubre completos los periodos del `nivel` que empiezan entre `inicio` y `fin`.
+
+    Devuelve None si ninguno empieza dentro; sirve para convertir una selección con el cursor
+    sobre la serie agrupada en un rango de días completos.
+    """
+    frecuencia = NIVELES_TEMPORALES[nivel]
+    primero = pd.Period(pd.Timestamp(inicio), frecuencia)
+    if primero.start_time < pd.Timestamp(inicio):
+        primero += 1
+    ultimo = pd.Period(pd.Timestamp(fin), frecuencia)
+    if primero > ultimo:
+        return None
+    return primero.start_time, ultimo.end_time.floor('D')
+
+def nivel_temporal_automatico(dias, puntos_maximos, rango=None):
+    """Nivel más fino cuya serie tiene como máximo `puntos_maximos` puntos dentro del `rango`.
+
+    `dias` son las fechas (sin hora) con datos; si ningún nivel cabe se devuelve el más grueso.
+    """
+    dias = pd.DatetimeIndex(dias)
+    if rango is not None:
+        dias = dias[(dias >= pd.Timestamp(rango[0]).floor('D')) & (dias <= pd.Timestamp(rango[1]))]
+    for nivel, frecuencia in NIVELES_TEMPORALES.items():
+        if dias.to_period(frecuencia).nunique() <= puntos_maximos:
+            return nivel
+    return nivel
+
+# Periodo con el que se compara cada nivel en la variación interanual (52 semanas conservan el día)
+DESPLAZAMIENTO_INTERANUAL = {
+    'Día': pd.DateOffset(years=1),
+    'Semana': pd.Timedelta(weeks=52),
+    'Mes': pd.DateOffset(years=1),
+    'Trimestre': pd.DateOffset(years=1),
+    'Año': pd.DateOffset(years=1),
+}
+
+def analizar_serie(serie, nivel, ventana=None):
+    """Serie por periodo con utilidad, margen (%), medias móviles, acumulados del año y variación interanual.
+
+    Se calcula con operaciones de ventana sobre los periodos ya agregados, sin volver a las filas.
+    Las medias móviles (columnas `*_media_movil`) usan `ventana` periodos del nivel; la variación
+    interanual de ingresos compara cada periodo con el de un año antes (NaN si no hay datos).
+    """
+    # En float64: los productos y acumulados desbordarían las columnas compactadas a int32
+    serie = serie.sort_values('Fecha', ignore_index=True).astype({'Ingresos': 'float64', 'Egresos': 'float64'})
+    serie['Utilidad'] = serie['Ingresos'] - serie['Egresos']
+    serie['Margen'] = 100 * serie['Utilidad'] / serie['Ingresos'].where(serie['Ingresos'] != 0)
+    año = serie['Fecha'].dt.year
+    for medida in ['Ingresos', 'Egresos', 'Utilidad']:
+        if ventana:
+            serie[f'{medida}_media_movil'] = serie[medida].rolling(ventana).mean()
+        serie[f'{medida}_acumulado'] = serie[medida].groupby(año).cumsum()
+    anterior = serie.set_index('Fecha')['Ingresos'].reindex(serie['Fecha'] - DESPLAZAMIENTO_INTERANUAL[nivel])
+    anterior = anterior.where(anterior != 0).to_numpy()
+    serie['Ingresos_interanual'] = 100 * (serie['Ingresos'].to_numpy() / anterior - 1)
+    return serie
+
+def indicadores_acumulados(serie_diaria):
+    """Ingresos y utilidad del año hasta la última fecha (YTD) y su variación interanual.
+
+    La variación compara con el mismo tramo del año anterior y es None si la serie no lo cubre
+    desde su primer mes. Devuelve None si la serie está vacía.
+    """
+    if serie_diaria.empty:
+        return None
+    fechas = serie_diaria['Fecha']
+    ultima = fechas.max()
+    inicio = pd.Timestamp(year=ultima.year, month=1, day=1)
+    actual = serie_diaria[(fechas >= inicio) & (fechas <= ultima)]
+    indicadores = {
+        'año': ultima.year,
+        'ingresos': actual['Ingresos'].sum(),
+        'utilidad': actual['Ingresos'].sum() - actual['Egresos'].sum(),
+        'interanual': None,
+    }
+
+    inicio_anterior = inicio - pd.DateOffset(years=1)
+    if fechas.min() < inicio_anterior + pd.DateOffset(months=1):
+        anterior = serie_diaria[(fechas >= inicio_anterior) & (fechas <= ultima - pd.DateOffset(years=1))]
+        ingresos_anterior = anterior['Ingresos'].sum()
+        if ingresos_anterior:
+            indicadores['interanual'] = 100 * (indicadores['ingresos'] / ingresos_anterior - 1)
+    return indicadores
+
+def resumen_por_categoria(df):
+    """Resumen por categoría agrupando las filas (cuando no hay agregados precalculados)"""
+    return df.groupby('Categoria', observed=True).agg({
+        'Ingresos': ['sum', 'mean', 'count'],
+        'Egresos': ['sum', 'mean'],
+        'Utilidad': ['sum', 'mean']
+    }).round(2)
+
+def opciones_filtros(df):
+    """Valores disponibles para los widgets de filtro a partir de un dataset cargado"""
+    opciones = {}
+    if 'Categoria' in df.columns:
+        opciones['categorias'] = df['Categoria'].unique()
+    if 'Fecha' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        opciones['fecha_min'] = df['Fecha'].min().date()
+        opciones['fecha_max'] = df['Fecha'].max().date()
+    for nombre in ['regiones', 'departamentos']:
+        if FILTROS_DIMENSION[nombre] in df.columns:
+            opciones[nombre] = df[FILTROS_DIMENSION[nombre]].unique()
+    return opciones
+
+def admite_cubo_mensual(df):
+    """Indica si el dataset tiene las columnas que necesita CuboMensual"""
+    if 'Fecha' not in df.columns or not pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        return False
+    return set(MEDIDAS_CUBO) <= set(df.columns) and 'Categoria' in df.columns
+
+def filtrar_dataset(df, indice, filtros):
+    """Posiciones y filas de `df` que cumplen los filtros (sin copiar si se conservan todas)"""
+    posiciones = indice.filtrar(**filtros)
+    if len(posiciones) == len(df):
+        return posiciones, df
+    return posiciones, df.take(posiciones)
+
+def seleccionar_celdas(cubos, filtros):
+    """(cubo, celdas) del primero de `cubos` que responde los filtros con celdas completas, o (None, None)"""
+    for cubo in cubos:
+        celdas = cubo.seleccionar(**filtros) if cubo is not None else None
+        if celdas is not None:
+            return cubo, celdas
+    return None, None
+
+def agregar_filtrados(cubo, filtros, df_filtrado, cubo_diario=None):
+    """Totales, serie temporal, utilidad y resumen por categoría de los datos filtrados.
+
+    Se responden con las celdas del cubo cuando los filtros abarcan celdas completas (o con las
+    del `cubo_diario`, RollupsTemporales.cubo_diario, si el rango corta meses); si no, los
+    totales se suman sobre las filas y los agregados quedan en None para que gráficos y resumen
+    agrupen `df_filtrado`.
+    Devuelve (totales, serie, utilidad, resumen).
+    """
+    cubo, celdas = seleccionar_celdas([cubo, cubo_diario], filtros)
+    if celdas is not None:
+        return (
+            cubo.totales(celdas),
+            cubo.serie_temporal(celdas),
+            cubo.utilidad_por_categoria(celdas),
+            cubo.resumen_categoria(celdas) if not celdas.empty else None,
+        )
+
+    totales = {col: df_filtrado[col].sum() for col in ['Ingresos', 'Egresos'] if col in df_filtrado.columns}
+    totales['Registros'] = len(df_filtrado)
+    return totales, None, None, None
@@ -0,0 +1,288 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# --------------------
+# GRÁFICOS
+# --------------------
+# Reducción de puntos y construcción de las figuras de Plotly. Sin dependencias de Streamlit:
+# los usan el dashboard y el benchmark del pipeline.
+
+# Reducción de puntos del gráfico de tendencia
+METODOS_REDUCCION = ['LTTB', 'Mín/Máx', 'Sin reducción']
+UMBRAL_WEBGL = 1000  # A partir de esta cantidad de puntos se dibuja con WebGL (Scattergl)
+
+# Indicadores del gráfico de tendencia en el eje secundario: etiqueta -> columna de analizar_serie
+INDICADORES_TENDENCIA = {
+    'Ninguno': None,
+    'Margen (%)': 'Margen',
+    'Variación interanual de ingresos (%)': 'Ingresos_interanual',
+    'Ingresos acumulados del año': 'Ingresos_acumulado',
+    'Utilidad acumulada del año': 'Utilidad_acumulado',
+}
+
+def reducir_lttb(x, y, puntos):
+    """Índices elegidos por Largest-Triangle-Three-Buckets, que conserva la forma visual de la serie"""
+    n = len(y)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+    bordes = np.append(bordes, n)
+    indices = np.empty(puntos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Vértice promedio del bucket siguiente (el último punto para el último bucket)
+        siguiente = slice(bordes[i + 1], bordes[i + 2]) if i + 2 < len(bordes) else slice(n - 1, n)
+        x_prom, y_prom = x[siguiente].mean(), y[siguiente].mean()
+        areas = np.abs(
+            (x[a] - x_prom) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (y_prom - y[a])
+        )
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def reducir_min_max(y, puntos):
+    """Índices del mínimo y el máximo de cada bucket (más los extremos de la serie)"""
+    n = len(y)
+    if puntos >= n or puntos < 4:
+        return np.arange(n)
+
+    buckets = np.arange(n) * (puntos // 2) // n
+    orden = np.lexsort((y, buckets))
+    cortes = np.flatnonzero(np.diff(buckets[orden])) + 1
+    minimos = orden[np.r_[0, cortes]]
+    maximos = orden[np.r_[cortes - 1, n - 1]]
+    return np.unique(np.concatenate([[0, n - 1], minimos, maximos]))
+
+def reducir_serie(x, y, puntos, metodo='LTTB'):
+    """Reduce la serie (x, y) a aproximadamente `puntos` puntos con el método indicado"""
+    if metodo == 'Sin reducción' or not puntos or len(y) <= puntos:
+        return x, y
+    x_valores = np.asarray(x)
+    y_valores = np.asarray(y, dtype='float64')
+    if metodo == 'Mín/Máx':
+        indices = reducir_min_max(y_valores, puntos)
+    else:
+        x_numerico = x_valores.astype('datetime64[ns]').astype('int64').astype('float64') \
+            if np.issubdtype(x_valores.dtype, np.datetime64) else x_valores.astype('float64')
+        indices = reducir_lttb(x_numerico, y_valores, puntos)
+    return x_valores[indices], y_valores[indices]
+
+def crear_grafico_lineas(df, tema, categorias_seleccionadas, df_agrupado=None,
+                         puntos_maximos=None, metodo_reduccion='LTTB', rango_visible=None, indicador=None):
+    """Crea un gráfico de líneas con colores elegantes en escala de grises
+
+    Si se recibe `df_agrupado` (Ingresos y Egresos ya sumados por Fecha) no se reagrupa `df`.
+    Con `rango_visible` solo se dibujan las fechas de ese rango, y cada serie se reduce a
+    `puntos_maximos` puntos; por encima de UMBRAL_WEBGL puntos se dibuja con Scattergl.
+    Las medias móviles de `df_agrupado` (ver analizar_serie) se dibujan junto a su medida y la
+    columna `indicador` (una etiqueta de INDICADORES_TENDENCIA) en un eje secundario.
+    """
+    if df_agrupado is None:
+        # Filtrar por categorías seleccionadas
+        df_filtrado = df[df['Categoria'].isin(categorias_seleccionadas)]
+        
+        # Agrupar por fecha
+        df_agrupado = df_filtrado.groupby('Fecha').agg({
+            'Ingresos': 'sum',
+            'Egresos': 'sum'
+        }).reset_index()
+    
+    if rango_visible is not None:
+        df_agrupado = df_agrupado[
+            (df_agrupado['Fecha'] >= rango_visible[0]) & (df_agrupado['Fecha'] <= rango_visible[1])
+        ]
+    
+    x_ingresos, y_ingresos = reducir_serie(df_agrupado["Fecha"], df_agrupado["Ingresos"], puntos_maximos, metodo_reduccion)
+    x_egresos, y_egresos = reducir_serie(df_agrupado["Fecha"], df_agrupado["Egresos"], puntos_maximos, metodo_reduccion)
+    
+    # Con muchos puntos se usa WebGL y se omiten los marcadores
+    usar_webgl = max(len(x_ingresos), len(x_egresos)) > UMBRAL_WEBGL
+    Traza = go.Scattergl if usar_webgl else go.Scatter
+    modo = 'lines' if usar_webgl else 'lines+markers'
+    
+    fig = go.Figure()
+    
+    # Colores elegantes según el tema
+    if tema == "Oscuro":
+        color_ingresos = "#ffffff"  # Blanco puro para ingresos
+        color_egresos = "#808080"   # Gris medio para egresos
+        bg_color = "#0a0a0a"
+        text_color = "#e0e0e0"
+        grid_color = "#2a2a2a"
+    else:
+        color_ingresos = "#1a1a1a"  # Negro para ingresos
+        color_egresos = "#666666"   # Gris oscuro para egresos
+        bg_color = "#fafafa"
+        text_color = "#2a2a2a"
+        grid_color = "#e0e0e0"
+    
+    # Línea sólida para Ingresos con gradiente
+    fig.add_trace(Traza(
+        x=x_ingresos,
+        y=y_ingresos,
+        mode=modo,
+        name='Ingresos',
+        line=dict(color=color_ingresos, width=4),
+        marker=dict(size=10, color=color_ingresos, line=dict(width=2, color=bg_color)),
+        fill='tonexty' if tema == "Oscuro" else None,
+        fillcolor='rgba(255, 255, 255, 0.1)' if tema == "Oscuro" else 'rgba(26, 26, 26, 0.1)'
+    ))
+    
+    # Línea para Egresos
+    fig.add_trace(Traza(
+        x=x_egresos,
+        y=y_egresos,
+        mode=modo,
+        name='Egresos',
+        line=dict(color=color_egresos, width=4, dash='dot'),
+        marker=dict(size=10, color=color_egresos, line=dict(width=2, color=bg_color))
+    ))
+    
+    # Medias móviles: líneas finas del color de su medida
+    for medida, color in [('Ingresos', color_ingresos), ('Egresos', color_egresos)]:
+        if f'{medida}_media_movil' in df_agrupado.columns:
+            x_media, y_media = reducir_serie(
+                df_agrupado["Fecha"], df_agrupado[f'{medida}_media_movil'], puntos_maximos, metodo_reduccion
+            )
+            fig.add_trace(Traza(
+                x=x_media,
+                y=y_media,
+                mode='lines',
+                name=f'{medida} (media móvil)',
+                line=dict(color=color, width=2, dash='dash'),
+                opacity=0.7
+            ))
+    
+    # Indicador adicional en el eje secundario
+    columna_indicador = INDICADORES_TENDENCIA.get(indicador)
+    if columna_indicador in df_agrupado.columns:
+        x_indicador, y_indicador = reducir_serie(
+            df_agrupado["Fecha"], df_agrupado[columna_indicador], puntos_maximos, metodo_reduccion
+        )
+        fig.add_trace(Traza(
+            x=x_indicador,
+            y=y_indicador,
+            mode='lines',
+            name=indicador,
+            yaxis='y2',
+            line=dict(color="#a0a0a0" if tema == "Oscuro" else "#999999", width=2, dash='dashdot')
+        ))
+        fig.update_layout(yaxis2=dict(
+            title=indicador,
+            overlaying='y',
+            side='right',
+            showgrid=False,
+            tickcolor=text_color,
+            title_font_color=text_color,
+            tickfont_color=text_color
+        ))
+    
+    fig.update_layout(
+        title=dict(
+            text="Ingresos y Egresos por Período",
+            font=dict(color=text_color, size=20, family="Arial Black")
+        ),
+        paper_bgcolor=bg_color,
+        plot_bgcolor=bg_color,
+        font=dict(color=text_color, family="Arial"),
+        height=450,
+        xaxis=dict(
+            gridcolor=grid_color, 
+            title="Fecha", 
+            tickcolor=text_color, 
+            linecolor=text_color,
+            title_font_color=text_color,
+            tickfont_color=text_color
+        ),
+        yaxis=dict(
+            gridcolor=grid_color, 
+            title="Monto", 
+            tickcolor=text_color, 
+            linecolor=text_color,
+            title_font_color=text_color,
+            tickfont_color=text_color
+        ),
+        legend=dict(
+            bgcolor='rgba(0,0,0,0)',
+            bordercolor=grid_color,
+            borderwidth=1,
+            font=dict(color=text_color)
+        )
+    )
+    
+    return fig
+
+def crear_grafico_barras_categorias(df, tema, categorias_seleccionadas, df_agrupado=None, seleccionadas=None):
+    """Crea un gráfico de barras por categorías con degradados elegantes
+
+    Si se recibe `df_agrupado` (Utilidad ya sumada por Categoria) no se reagrupa `df`. Con
+    `seleccionadas` (categorías elegidas como filtro cruzado) las demás barras se atenúan.
+    """
+    if df_agrupado is None:
+        # Filtrar y agrupar por categoría
+        df_filtrado = df[df['Categoria'].isin(categorias_seleccionadas)]
+        df_agrupado = df_filtrado.groupby('Categoria', observed=True).agg({
+            'Utilidad': 'sum'
+        }).reset_index()
+    
+    if tema == "Oscuro":
+        # Degradados de gris claro a blanco para positivos, gris medio a oscuro para negativos
+        color_positivo = "#e0e0e0"
+        color_negativo = "#606060"
+        bg_color = "#0a0a0a"
+        text_color = "#e0e0e0"
+        grid_color = "#2a2a2a"
+    else:
+        # Negro a gris oscuro para positivos, gris medio para negativos
+        color_positivo = "#2a2a2a"
+        color_negativo = "#888888"
+        bg_color = "#fafafa"
+        text_color = "#2a2a2a"
+        grid_color = "#e0e0e0"
+    
+    colors = [color_positivo if x >= 0 else color_negativo for x in df_agrupado["Utilidad"]]
+    
+    fig = go.Figure(data=[
+        go.Bar(
+            x=df_agrupado["Categoria"],
+            y=df_agrupado["Utilidad"],
+            marker=dict(
+                color=colors,
+                line=dict(width=2, color=bg_color),
+                opacity=0.9 if seleccionadas is None else [
+                    0.9 if categoria in seleccionadas else 0.3 for categoria in df_agrupado["Categoria"]
+                ]
+            ),
+            name="Utilidad por Categoría"
+        )
+    ])
+    
+    fig.update_layout(
+        title=dict(
+            text="Utilidad por Categoría",
+            font=dict(color=text_color, size=20, family="Arial Black")
+        ),
+        paper_bgcolor=bg_color,
+        plot_bgcolor=bg_color,
+        font=dict(color=text_color, family="Arial"),
+        height=450,
+        xaxis=dict(
+            title="Categoría",
+            title_font=dict(size=14, color=text_color),
+            tickfont=dict(color=text_color)
+        ),
+        yaxis=dict(
+            title="Utilidad",
+            title_font=dict(size=14, color=text_color),
+            gridcolor=grid_color,
+            showgrid=True,
+            gridwidth=1,
+            tickfont=dict(color=text_color)
+        ),
+        showlegend=False
+    )
+    
+    return fig
@@ -0,0 +1,451 @@
+import io
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# --------------------
+# INGESTA DE ARCHIVOS
+# --------------------
+# Funciones sin dependencias de Streamlit: se ejecutan también en los procesos del pool de
+# carga de varios archivos.
+
+# Tipos explícitos para la lectura por bloques: dimensiones como categóricas y montos en float64
+# (compactar_dataset los pasa a int32 solo si son enteros sin vacíos; nunca a float32)
+ESQUEMA_FINANCIERO = {
+    'Categoria': 'category',
+    'Departamento': 'category',
+    'Region': 'category',
+    'Ingresos': 'float64',
+    'Egresos': 'float64',
+}
+
+def unir_bloques(bloques):
+    """Concatena bloques leídos por separado unificando las categorías de las columnas categóricas"""
+    columnas = {}
+    for col in bloques[0].columns:
+        partes = [bloque[col] for bloque in bloques]
+        if isinstance(partes[0].dtype, pd.CategoricalDtype):
+            columnas[col] = pd.Series(union_categoricals(partes), name=col)
+        else:
+            columnas[col] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(columnas)
+
+# Detección de la columna de fecha sobre una muestra de filas
+FILAS_MUESTRA_FECHA = 500
+UMBRAL_FECHA = 0.9  # Fracción mínima de valores de la muestra que el formato debe convertir
+FORMATOS_FECHA = [
+    '%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d', '%Y-%m',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+]
+NOMBRES_FECHA = ('fecha', 'date', 'dia', 'día', 'periodo', 'período')
+
+def es_columna_texto(serie):
+    """Indica si la serie contiene texto (object o string)"""
+    return pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)
+
+def muestrear_filas(df, filas=FILAS_MUESTRA_FECHA):
+    """Muestra de filas repartidas uniformemente por el DataFrame"""
+    return df.iloc[::max(1, len(df) // filas)].head(filas)
+
+def detectar_columna_fecha(muestra, columna=None, formato=None):
+    """Elige la columna de fecha y su formato a partir de una muestra de filas.
+
+    Cada columna de texto (o solo `columna`, si se indica) se puntúa con la fracción de valores
+    que convierte cada formato candidato (o solo `formato`), más un pequeño bonus si el nombre
+    sugiere una fecha. Ante empates gana el primer formato de FORMATOS_FECHA, así que el orden
+    resuelve la ambigüedad día/mes. Devuelve (columna, formato) o (None, None).
+    """
+    if columna:
+        candidatas = [columna] if columna in muestra.columns else []
+    else:
+        candidatas = [col for col in muestra.columns if es_columna_texto(muestra[col])]
+    formatos = [formato] if formato else FORMATOS_FECHA
+
+    mejor_puntaje, mejor_columna, mejor_formato = 0.0, None, None
+    for col in candidatas:
+        valores = muestra[col].dropna().astype(str).str.strip()
+        valores = valores[valores != ''].head(FILAS_MUESTRA_FECHA)
+        if valores.empty:
+            continue
+        bonus = 0.05 if any(nombre in str(col).lower() for nombre in NOMBRES_FECHA) else 0.0
+        for fmt in formatos:
+            try:
+                convertidos = pd.to_datetime(valores, format=fmt, errors='coerce')
+            except (ValueError, TypeError):
+                continue
+            fraccion = convertidos.notna().mean()
+            if fraccion >= UMBRAL_FECHA and fraccion + bonus > mejor_puntaje:
+                mejor_puntaje, mejor_columna, mejor_formato = fraccion + bonus, col, fmt
+
+    if mejor_columna is None and columna and formato:
+        # El usuario declaró columna y formato: se respetan aunque la muestra no los confirme
+        return (columna, formato) if columna in muestra.columns else (None, None)
+    return mejor_columna, mejor_formato
+
+def convertir_fecha(serie, formato):
+    """Convierte una columna a fecha con un formato explícito (valores inválidos como NaT)"""
+    return pd.to_datetime(serie, format=formato, errors='coerce')
+
+def leer_csv_por_bloques(archivo, columna_fecha=None, formato_fecha=None, filas_por_bloque=200_000, progreso=None):
+    """Lee un CSV en bloques con ESQUEMA_FINANCIERO para acotar la memoria pico.
+
+    La columna de fecha (declarada o detectada sobre una muestra) se convierte en cada bloque con
+    un formato explícito y se renombra a Fecha. `progreso` recibe (filas cargadas, fracción leída
+    del archivo) después de cada bloque.
+    """
+    # La muestra se lee con la inferencia de tipos de pandas, como en la lectura normal, para que
+    # las columnas numéricas (p. ej. referencias yyyymmdd) no se tomen por fechas
+    muestra = pd.read_csv(archivo, nrows=FILAS_MUESTRA_FECHA)
+    archivo.seek(0)
+    if columna_fecha and columna_fecha not in muestra.columns:
+        raise ValueError(f"No se encontró la columna de fecha declarada: '{columna_fecha}'")
+    columna_fecha, formato_fecha = detectar_columna_fecha(muestra, columna_fecha, formato_fecha)
+
+    tipos = {col: tipo for col, tipo in ESQUEMA_FINANCIERO.items() if col in muestra.columns}
+    if columna_fecha is not None:
+        tipos[columna_fecha] = str
+    tamaño_total = getattr(archivo, 'size', None)
+    bloques = []
+    filas = 0
+    for bloque in pd.read_csv(archivo, dtype=tipos, chunksize=filas_por_bloque):
+        if columna_fecha is not None:
+            bloque[columna_fecha] = convertir_fecha(bloque[columna_fecha], formato_fecha)
+        bloques.append(bloque)
+        filas += len(bloque)
+        if progreso is not None:
+            progreso(filas, min(archivo.tell() / tamaño_total, 1.0) if tamaño_total else None)
+
+    if not bloques:
+        raise ValueError("El archivo no contiene registros")
+    df = unir_bloques(bloques)
+    if columna_fecha is not None and 'Fecha' not in df.columns:
+        df = df.rename(columns={columna_fecha: 'Fecha'})
+    return df
+
+# Columnas de dimensiones que siempre se codifican como categóricas
+COLUMNAS_DIMENSION = ['Categoria', 'Departamento', 'Region']
+MAX_PROPORCION_CATEGORIAS = 0.5  # Texto con más valores distintos que esta fracción de filas no se codifica
+RANGO_INT32 = np.iinfo(np.int32)
+
+def memoria_dataset(df):
+    """Bytes que ocupa el DataFrame, incluido el contenido de las columnas de texto"""
+    return int(df.memory_usage(deep=True).sum())
+
+def memoria_estructura(objeto, vistos=None):
+    """Bytes aproximados de DataFrames, arrays y objetos que los contienen (índices, cubos, rollups...).
+
+    Cada objeto se cuenta una sola vez aunque varias estructuras lo compartan.
+    """
+    vistos = set() if vistos is None else vistos
+    if id(objeto) in vistos:
+        return 0
+    vistos.add(id(objeto))
+    if isinstance(objeto, pd.DataFrame):
+        return memoria_dataset(objeto)
+    if isinstance(objeto, (pd.Series, pd.Index)):
+        return int(objeto.memory_usage(deep=True))
+    if isinstance(objeto, np.ndarray):
+        return int(objeto.nbytes)
+    if isinstance(objeto, (list, tuple)):
+        return sum(memoria_estructura(valor, vistos) for valor in objeto)
+    if isinstance(objeto, dict):
+        return sum(memoria_estructura(valor, vistos) for valor in objeto.values())
+    if hasattr(objeto, '__dict__'):
+        return memoria_estructura(vars(objeto), vistos)
+    return 0
+
+def compactar_dataset(df):
+    """Reduce la memoria del dataset sin perder información.
+
+    Las dimensiones (y el texto con pocos valores distintos) pasan a categóricas, los enteros
+    de 64 bits a 32 si su rango lo permite (no menos, para que sumas y restas entre columnas no
+    desborden) y también los float64 sin vacíos cuyos valores son todos enteros (montos leídos
+    como float). El resto de los float64 se conserva: en float32 las sumas de montos de millones
+    de filas se acumulan en 32 bits y los totales se desvían.
+    Guarda los bytes antes y después en df.attrs['memoria'].
+    """
+    antes = memoria_dataset(df)
+    for col in df.columns:
+        serie = df[col]
+        if es_columna_texto(serie):
+            if col in COLUMNAS_DIMENSION or serie.nunique() <= MAX_PROPORCION_CATEGORIAS * len(serie):
+                df[col] = serie.astype('category')
+        elif isinstance(serie.dtype, np.dtype) and serie.dtype == np.int64:
+            if serie.empty or (serie.min() >= RANGO_INT32.min and serie.max() <= RANGO_INT32.max):
+                df[col] = serie.astype(np.int32)
+        elif isinstance(serie.dtype, np.dtype) and serie.dtype == np.float64:
+            valores = serie.to_numpy()
+            if (valores.size and np.isfinite(valores).all() and (valores == np.trunc(valores)).all()
+                    and valores.min() >= RANGO_INT32.min and valores.max() <= RANGO_INT32.max):
+                df[col] = valores.astype(np.int32)
+    df.attrs['memoria'] = {'antes': antes, 'despues': memoria_dataset(df)}
+    return df
+
+def derivar_columnas(df, detectar_fechas=True, columna_fecha=None, formato_fecha=None):
+    """Aplica las derivaciones comunes a todos los formatos: columna de fecha y utilidad"""
+    if detectar_fechas:
+        if columna_fecha and columna_fecha not in df.columns:
+            return None, f"No se encontró la columna de fecha declarada: '{columna_fecha}'"
+
+        # Detectar la columna de fecha sobre una muestra y convertirla una sola vez
+        columnas_datetime = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+        if columna_fecha is None and 'Fecha' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+            col, fmt = None, None
+        elif columna_fecha is None and 'Fecha' not in df.columns and columnas_datetime:
+            # Fechas ya tipadas (p. ej. celdas de fecha de Excel): se prefiere la que por nombre parece una fecha
+            col = next((c for c in columnas_datetime if any(nombre in str(c).lower() for nombre in NOMBRES_FECHA)),
+                       columnas_datetime[0])
+            fmt = None
+        else:
+            col, fmt = detectar_columna_fecha(muestrear_filas(df), columna_fecha, formato_fecha)
+        if col is not None:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = convertir_fecha(df[col], fmt)
+            if col != 'Fecha' and 'Fecha' not in df.columns:
+                df = df.rename(columns={col: 'Fecha'})
+
+    # Verificar si existen las columnas necesarias para calcular utilidad
+    if 'Ingresos' in df.columns and 'Egresos' in df.columns:
+        df['Utilidad'] = df['Ingresos'] - df['Egresos']
+    else:
+        missing = [col for col in ['Ingresos', 'Egresos'] if col not in df.columns]
+        return None, f"Faltan columnas necesarias para calcular utilidad: {missing}"
+
+    return compactar_dataset(df), None
+
+def procesar_archivo_csv(uploaded_file, por_bloques=False, columna_fecha=None, formato_fecha=None, progreso=None):
+    """Procesa archivo CSV subido por el usuario y calcula la utilidad"""
+    try:
+        if por_bloques:
+            # Lectura por bloques con esquema tipado
+            df = leer_csv_por_bloques(uploaded_file, columna_fecha, formato_fecha, progreso=progreso)
+            return derivar_columnas(df, detectar_fechas=False)
+
+        # Leer el archivo
+        return derivar_columnas(pd.read_csv(uploaded_file), columna_fecha=columna_fecha, formato_fecha=formato_fecha)
+    except Exception as e:
+        return None, str(e)
+
+# Motor de lectura de Excel: calamine (Rust) es mucho más rápido que openpyxl si está instalado
+MOTOR_EXCEL = 'calamine' if importlib.util.find_spec('python_calamine') else None
+
+def listar_hojas_excel(archivo):
+    """Nombres de las hojas de un archivo Excel"""
+    try:
+        return pd.ExcelFile(archivo, engine=MOTOR_EXCEL).sheet_names
+    finally:
+        archivo.seek(0)
+
+def procesar_archivo_excel(uploaded_file, hojas=None, columnas=None, columna_fecha=None, formato_fecha=None):
+    """Procesa archivo Excel subido por el usuario y calcula la utilidad
+
+    `hojas` es una lista de nombres (por defecto la primera hoja), que se concatenan, y
+    `columnas` un rango estilo Excel como "A:F".
+    """
+    try:
+        leidas = pd.read_excel(
+            uploaded_file,
+            sheet_name=list(hojas) if hojas else 0,
+            usecols=columnas or None,
+            engine=MOTOR_EXCEL
+        )
+        if isinstance(leidas, dict):
+            leidas = pd.concat(leidas.values(), ignore_index=True)
+        return derivar_columnas(leidas, columna_fecha=columna_fecha, formato_fecha=formato_fecha)
+    except Exception as e:
+        return None, str(e)
+
+def leer_excel_con_cache(uploaded_file, hash_contenido, directorio_cache, **opciones):
+    """Procesa un Excel guardando el resultado como Parquet en `directorio_cache`.
+
+    El archivo convertido se identifica por el hash del contenido y las opciones de lectura, así
+    que el mismo Excel se lee con el motor de Excel una sola vez aunque se reinicie el servidor.
+    """
+    huella_opciones = hashlib.sha256(repr(sorted(opciones.items())).encode()).hexdigest()[:16]
+    ruta = Path(directorio_cache) / f"excel_{hash_contenido}_{huella_opciones}.parquet"
+    if ruta.exists():
+        try:
+            return pd.read_parquet(ruta), None
+        except Exception:
+            ruta.unlink(missing_ok=True)
+
+    df, error = procesar_archivo_excel(uploaded_file, **opciones)
+    if error is None:
+        try:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            temporal = ruta.with_suffix('.tmp')
+            df.to_parquet(temporal, index=False)
+            os.replace(temporal, ruta)
+        except Exception:
+            # Columnas con tipos mixtos no se pueden guardar en Parquet: se usa sin convertir
+            pass
+    return df, error
+
+def procesar_archivo_bytes(nombre, contenido, opciones=None):
+    """Procesa un archivo a partir de su nombre y contenido (trabajo de un proceso del pool)"""
+    archivo = io.BytesIO(contenido)
+    archivo.name = nombre
+    archivo.size = len(contenido)
+    opciones = opciones or {}
+    if nombre.endswith('.csv'):
+        return procesar_archivo_csv(archivo, **opciones)
+    opciones_fecha = {clave: valor for clave, valor in opciones.items() if clave in ('columna_fecha', 'formato_fecha')}
+    return procesar_archivo_excel(archivo, **opciones_fecha)
+
+def procesar_archivos_en_paralelo(archivos, opciones=None, max_procesos=None, progreso=None, metodo_inicio=None):
+    """Procesa varios archivos [(nombre, contenido)] en un pool de procesos.
+
+    Devuelve ({nombre: DataFrame}, {nombre: error}) conservando el orden de entrada. `progreso`
+    recibe (nombre, error, completados, total) cada vez que termina un archivo. `metodo_inicio`
+    es el de multiprocessing; 'fork' solo es seguro desde procesos de un único hilo (p. ej. la CLI).
+    """
+    resultados, errores = {}, {}
+    if not archivos:
+        return resultados, errores
+
+    # Por defecto forkserver (o spawn): hacer fork del servidor de Streamlit, que tiene varios
+    # hilos, puede bloquear al hijo si otro hilo tenía tomado un lock al copiar el proceso
+    metodo = metodo_inicio or ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+    max_procesos = min(max_procesos or os.cpu_count() or 1, len(archivos))
+    with ProcessPoolExecutor(max_workers=max_procesos, mp_context=multiprocessing.get_context(metodo)) as pool:
+        futuros = {
+            pool.submit(procesar_archivo_bytes, nombre, contenido, opciones): nombre
+            for nombre, contenido in archivos
+        }
+        for completados, futuro in enumerate(as_completed(futuros), start=1):
+            nombre = futuros[futuro]
+            try:
+                df, error = futuro.result()
+            except Exception as e:
+                df, error = None, str(e)
+            if error:
+                errores[nombre] = error
+            else:
+                resultados[nombre] = df
+            if progreso is not None:
+                progreso(nombre, error, completados, len(archivos))
+
+    orden = [nombre for nombre, _ in archivos]
+    return (
+        {nombre: resultados[nombre] for nombre in orden if nombre in resultados},
+        {nombre: errores[nombre] for nombre in orden if nombre in errores},
+    )
+
+def conciliar_esquemas(dataframes):
+    """Concatena los DataFrames de varios archivos reconciliando columnas y tipos.
+
+    Las columnas ausentes en algún archivo quedan como nulos, las fechas se convierten si algún
+    archivo las trae como fecha y las columnas categóricas en algún archivo se unifican como
+    categóricas. Devuelve (DataFrame, avisos).
+    """
+    dataframes = dict(dataframes)
+    avisos = []
+    columnas = list(dict.fromkeys(col for df in dataframes.values() for col in df.columns))
+
+    for col in columnas:
+        faltantes = [nombre for nombre, df in dataframes.items() if col not in df.columns]
+        if faltantes:
+            avisos.append(f"La columna '{col}' no existe en: {', '.join(faltantes)}")
+
+    unidas = {}
+    for col in columnas:
+        # Los archivos sin la columna aportan nulos del mismo tipo (float si el tipo no admite nulos)
+        tipo = next(df[col].dtype for df in dataframes.values() if col in df.columns)
+        if pd.api.types.is_integer_dtype(tipo) or pd.api.types.is_bool_dtype(tipo):
+            tipo = 'float64'
+        partes = [
+            df[col] if col in df.columns else pd.Series(None, index=df.index, name=col, dtype=tipo)
+            for df in dataframes.values()
+        ]
+        if any(pd.api.types.is_datetime64_any_dtype(parte) for parte in partes):
+            convertidas = [pd.to_datetime(parte, errors='coerce') for parte in partes]
+            nulos_nuevos = sum(int(c.isna().sum() - p.isna().sum()) for c, p in zip(convertidas, partes))
+            if nulos_nuevos:
+                avisos.append(f"{nulos_nuevos} valores de '{col}' no se pudieron convertir a fecha")
+            unidas[col] = pd.concat(convertidas, ignore_index=True)
+        elif all(isinstance(parte.dtype, pd.CategoricalDtype) for parte in partes) and len({
+            parte.cat.categories.dtype for parte in partes
+        }) == 1:
+            # Ya son categóricas compatibles: se unen los códigos sin pasar por texto
+            unidas[col] = pd.Series(union_categoricals(partes), name=col)
+        elif any(isinstance(parte.dtype, pd.CategoricalDtype) for parte in partes):
+            categoricas = [parte.astype(str).where(parte.notna()).astype('category') for parte in partes]
+            unidas[col] = pd.Series(union_categoricals(categoricas), name=col)
+        else:
+            unidas[col] = pd.concat(partes, ignore_index=True)
+
+    df = pd.DataFrame(unidas)
+    df.attrs['memoria'] = {
+        'antes': sum(parte.attrs.get('memoria', {}).get('antes', memoria_dataset(parte)) for parte in dataframes.values()),
+        'despues': memoria_dataset(df),
+    }
+    return df, avisos
+
+def filas_repetidas(df_base, df_nuevo, claves):
+    """Máscara de las filas de df_base cuya clave aparece en df_nuevo.
+
+    Si la clave incluye Fecha, solo se comparan las filas del rango de fechas de df_nuevo.
+    """
+    repetidas = np.zeros(len(df_base), dtype=bool)
+    candidatas = np.ones(len(df_base), dtype=bool)
+    if 'Fecha' in claves and pd.api.types.is_datetime64_any_dtype(df_base['Fecha']):
+        fechas_nuevas = pd.to_datetime(df_nuevo['Fecha'], errors='coerce')
+        if fechas_nuevas.notna().any():
+            candidatas = df_base['Fecha'].between(fechas_nuevas.min(), fechas_nuevas.max()).to_numpy()
+    if candidatas.any():
+        claves_nuevas = pd.MultiIndex.from_frame(df_nuevo[claves])
+        repetidas[candidatas] = pd.MultiIndex.from_frame(df_base.loc[candidatas, claves]).isin(claves_nuevas)
+    return repetidas
+
+def meses_fecha(serie):
+    """Meses (datetime64[M]) de una columna de fechas"""
+    return serie.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+
+def anexar_datos(df_base, df_nuevo, claves=None, nombre_nuevo='archivos nuevos'):
+    """Agrega las filas de `df_nuevo` al final de `df_base` sin reprocesar el historial.
+
+    Con `claves`, las filas nuevas reemplazan a las existentes con la misma clave (entre las nuevas
+    gana la última). Devuelve (DataFrame, conservadas, periodos, avisos): `conservadas` es la
+    máscara de filas de df_base que siguen en el resultado (None si son todas) y `periodos` los
+    meses (datetime64[M]) con filas agregadas o eliminadas, para actualizar solo esos agregados.
+    """
+    avisos = []
+    claves = [col for col in (claves or []) if col in df_base.columns and col in df_nuevo.columns]
+    conservadas = None
+    if claves:
+        # Una clave repetida en el historial no identifica registros: el reemplazo descartaría filas legítimas
+        duplicadas_base = int(df_base.duplicated(subset=claves).sum())
+        if duplicadas_base:
+            avisos.append(
+                f"La clave {', '.join(claves)} no es única en el dataset cargado ({duplicadas_base} filas repetidas): "
+                "las filas nuevas pueden reemplazar registros distintos"
+            )
+        duplicadas_nuevas = int(df_nuevo.duplicated(subset=claves, keep='last').sum())
+        if duplicadas_nuevas:
+            df_nuevo = df_nuevo.drop_duplicates(subset=claves, keep='last')
+            avisos.append(f"{duplicadas_nuevas} filas repetidas dentro de los archivos nuevos se descartaron")
+        repetidas = filas_repetidas(df_base, df_nuevo, claves)
+        if repetidas.any():
+            conservadas = ~repetidas
+            avisos.append(f"{int(repetidas.sum())} filas existentes se reemplazaron por las nuevas con la misma clave")
+
+    partes = {
+        'dataset cargado': df_base if conservadas is None else df_base[conservadas],
+        nombre_nuevo: df_nuevo,
+    }
+    df, avisos_esquema = conciliar_esquemas(partes)
+
+    periodos = np.array([], dtype='datetime64[M]')
+    if 'Fecha' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        periodos = meses_fecha(df['Fecha'].iloc[len(df) - len(df_nuevo):])
+        if conservadas is not None:
+            periodos = np.concatenate([periodos, meses_fecha(df_base['Fecha'][~conservadas])])
+        periodos = np.unique(periodos)
+    return df, conservadas, periodos, avisos_esquema + avisos
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import pandas as pd
+
+# --------------------
+# PERFILADO DE ETAPAS
+# --------------------
+# Tiempos y memoria de las etapas de un rerun del dashboard. Sin dependencias de Streamlit.
+
+class Perfilador:
+    """Mide tiempo (y opcionalmente memoria) de las etapas de un rerun.
+
+    Inactivo no mide nada, así que las etapas pueden quedar instrumentadas siempre. La memoria
+    se mide con tracemalloc, que sigue todas las asignaciones del proceso (incluidas las de
+    otras sesiones) y hace más lento el código Python mientras está activo. Las etapas no deben
+    anidarse: cada una reinicia el pico de memoria.
+
+    tracemalloc es global al proceso: el trazado se inicia con la primera `sesion` que mide
+    memoria y solo se detiene cuando ninguna lo necesita, y nunca si lo inició otro código.
+    `sesion_activa(sesion)` permite olvidar las sesiones desconectadas.
+    """
+
+    _sesiones_memoria = set()
+    _trazado_propio = False
+    _lock = threading.Lock()
+
+    def __init__(self, activo=False, medir_memoria=False, ruta_log=None, sesion=None, sesion_activa=None):
+        self.activo = activo
+        self.medir_memoria = activo and medir_memoria
+        self.ruta_log = ruta_log if activo else None
+        self.etapas = []
+        self.inicio = time.perf_counter()
+        self._coordinar_trazado(sesion, self.medir_memoria, sesion_activa)
+
+    @classmethod
+    def _coordinar_trazado(cls, sesion, medir_memoria, sesion_activa=None):
+        """Registra si `sesion` mide memoria e inicia o detiene tracemalloc según corresponda"""
+        with cls._lock:
+            if medir_memoria:
+                cls._sesiones_memoria.add(sesion)
+            else:
+                cls._sesiones_memoria.discard(sesion)
+            if sesion_activa is not None:
+                cls._sesiones_memoria = {s for s in cls._sesiones_memoria if s == sesion or sesion_activa(s)}
+
+            if cls._sesiones_memoria and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                cls._trazado_propio = True
+            elif not cls._sesiones_memoria and cls._trazado_propio:
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                cls._trazado_propio = False
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Mide el bloque `with` como la etapa `nombre`"""
+        if not self.activo:
+            yield
+            return
+        if self.medir_memoria:
+            tracemalloc.reset_peak()
+            memoria_inicial = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            registro = {'etapa': nombre, 'segundos': round(time.perf_counter() - inicio, 6)}
+            if self.medir_memoria:
+                actual, pico = tracemalloc.get_traced_memory()
+                registro['memoria_pico_bytes'] = pico - memoria_inicial
+                registro['memoria_neta_bytes'] = actual - memoria_inicial
+            self.etapas.append(registro)
+
+    def envolver(self, nombre, funcion):
+        """Versión de `funcion` medida como etapa y guardada en el log al terminar.
+
+        Sirve para trabajo diferido que se ejecuta después del rerun (p. ej. exportaciones).
+        """
+        if not self.activo:
+            return funcion
+
+        @wraps(funcion)
+        def medida(*args, **kwargs):
+            with self.etapa(nombre):
+                resultado = funcion(*args, **kwargs)
+            if self.ruta_log:
+                self._escribir_log({'diferida': True, 'etapas': [self.etapas[-1]]})
+            return resultado
+        return medida
+
+    def total(self):
+        """Segundos transcurridos desde el inicio del rerun"""
+        return time.perf_counter() - self.inicio
+
+    def resumen(self):
+        """Desglose de las etapas medidas, con su porcentaje del total del rerun"""
+        resumen = pd.DataFrame(self.etapas, columns=['etapa', 'segundos', 'memoria_pico_bytes'])
+        resumen['% del total'] = (100 * resumen['segundos'] / self.total()).round(1)
+        resumen['memoria pico (MB)'] = (resumen.pop('memoria_pico_bytes') / 1024 ** 2).round(2)
+        return resumen
+
+    def guardar_log(self, **contexto):
+        """Agrega las etapas del rerun como una línea JSON al log (si está configurado)"""
+        if self.ruta_log:
+            self._escribir_log({**contexto, 'total_segundos': round(self.total(), 6), 'etapas': self.etapas})
+
+    def _escribir_log(self, registro):
+        linea = json.dumps({'fecha': datetime.now().isoformat(timespec='milliseconds'), **registro},
+                           ensure_ascii=False, default=str)
+        with open(self.ruta_log, 'a', encoding='utf-8') as archivo:
+            archivo.write(linea + '\n')
@@ -0,0 +1,256 @@
+"""Generación de reportes sin Streamlit para muchos cortes de región y categoría.
+
+Carga los datos una sola vez (archivos CSV/Excel o datos simulados), construye los índices de
+filtrado y el cubo mensual, y reparte los cortes entre procesos. Cada corte produce un archivo
+con las métricas principales, los dos gráficos del dashboard y el resumen por categoría, en HTML
+autocontenido o en JSON (figuras de Plotly serializadas). Al final se escribe indice.json con
+los archivos generados y los errores.
+
+Uso:
+    python reportes.py --datos ventas_2024.csv --salida reportes/ --por region-categoria
+    python reportes.py --simulados --desde 2024-01-01 --hasta 2024-06-30 --formato json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import plotly.io as pio
+
+from datos_financieros import (
+    CuboMensual,
+    IndiceFiltros,
+    admite_cubo_mensual,
+    agregar_filtrados,
+    filtrar_dataset,
+    generar_datos_simulados,
+    opciones_filtros,
+    resumen_por_categoria,
+)
+from graficos import crear_grafico_barras_categorias, crear_grafico_lineas
+from ingesta_datos import conciliar_esquemas, procesar_archivos_en_paralelo
+
+FORMATOS_REPORTE = ['html', 'json']
+CORTES = ['total', 'region', 'categoria', 'region-categoria']
+PUNTOS_GRAFICO = 600  # Puntos máximos por serie del gráfico de tendencia
+
+# Dataset, índice y cubo de cada proceso (heredados con fork o recibidos al iniciar el proceso)
+_CONTEXTO = {}
+
+def iniciar_proceso(df, indice, cubo):
+    """Guarda los datos compartidos en el proceso que generará los reportes"""
+    _CONTEXTO.update(df=df, indice=indice, cubo=cubo)
+
+def cargar_datos(rutas=None, simulados=None):
+    """DataFrame a partir de archivos CSV/Excel (unidos como en el dashboard) o de datos simulados"""
+    if not rutas:
+        return generar_datos_simulados(**(simulados or {}))
+
+    archivos = [(Path(ruta).name, Path(ruta).read_bytes()) for ruta in rutas]
+    # La CLI tiene un solo hilo: fork es seguro y evita reimportar pandas en cada proceso
+    metodo = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+    dataframes, errores = procesar_archivos_en_paralelo(archivos, metodo_inicio=metodo)
+    for nombre, error in errores.items():
+        print(f"❌ Error al procesar {nombre}: {error}", file=sys.stderr)
+    if not dataframes:
+        raise SystemExit("No se pudo cargar ningún archivo de datos")
+    df, avisos = conciliar_esquemas(dataframes)
+    for aviso in avisos:
+        print(f"⚠️ {aviso}", file=sys.stderr)
+    return df
+
+def definir_cortes(df, por='region-categoria'):
+    """Lista de cortes {'nombre', 'regiones', 'categorias'}; el corte total siempre se incluye"""
+    opciones = opciones_filtros(df)
+    regiones = [valor for valor in opciones.get('regiones', []) if pd.notna(valor)]
+    categorias = [valor for valor in opciones.get('categorias', []) if pd.notna(valor)]
+
+    cortes = [{'nombre': 'total', 'regiones': None, 'categorias': None}]
+    if por in ('region', 'region-categoria'):
+        cortes += [{'nombre': str(region), 'regiones': [region], 'categorias': None} for region in regiones]
+    if por in ('categoria', 'region-categoria'):
+        cortes += [{'nombre': str(categoria), 'regiones': None, 'categorias': [categoria]} for categoria in categorias]
+    if por == 'region-categoria':
+        cortes += [
+            {'nombre': f"{region} - {categoria}", 'regiones': [region], 'categorias': [categoria]}
+            for region in regiones for categoria in categorias
+        ]
+    return cortes
+
+def nombre_archivo(texto):
+    """Nombre de archivo seguro a partir de un texto libre"""
+    return re.sub(r'\W+', '_', texto.strip().lower()).strip('_') or 'reporte'
+
+def renderizar_html(titulo, generado, corte, totales, figuras, resumen):
+    """Documento HTML autocontenido con métricas, gráficos y resumen (Plotly desde CDN)"""
+    metricas = ''.join(
+        f"<div class='metrica'><div>{etiqueta}</div><strong>{valor}</strong></div>"
+        for etiqueta, valor in [
+            ("💰 Ingresos totales", f"${totales.get('Ingresos', 0):,.0f}"),
+            ("💸 Egresos totales", f"${totales.get('Egresos', 0):,.0f}"),
+            ("📈 Utilidad neta", f"${totales.get('Ingresos', 0) - totales.get('Egresos', 0):,.0f}"),
+            ("📊 Registros", f"{totales['Registros']:,}"),
+        ]
+    )
+    graficos = ''.join(
+        pio.to_html(figura, full_html=False, include_plotlyjs='cdn' if i == 0 else False)
+        for i, figura in enumerate(figuras)
+    )
+    tabla = resumen.to_html(border=0) if resumen is not None else "<p>No hay datos de categorías disponibles.</p>"
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>{titulo} · {corte}</title>
+<style>
+body {{ font-family: Arial, sans-serif; color: #2a2a2a; background: #fafafa; margin: 2rem; }}
+.metricas {{ display: flex; gap: 1rem; }}
+.metrica {{ flex: 1; padding: 1rem; border: 1px solid #e0e0e0; border-radius: 8px; background: #ffffff; }}
+.metrica strong {{ display: block; font-size: 1.6rem; margin-top: 0.5rem; }}
+table {{ border-collapse: collapse; }}
+th, td {{ padding: 0.3rem 0.8rem; border-bottom: 1px solid #e0e0e0; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>📊 {titulo}</h1>
+<p>Corte: <strong>{corte}</strong> · Generado: {generado}</p>
+<div class="metricas">{metricas}</div>
+{graficos}
+<h2>📈 Resumen por Categoría</h2>
+{tabla}
+</body>
+</html>
+"""
+
+def generar_reporte(corte, opciones):
+    """Genera el archivo de un corte con los datos del proceso y devuelve su entrada del índice"""
+    inicio = time.perf_counter()
+    df, indice, cubo = _CONTEXTO['df'], _CONTEXTO['indice'], _CONTEXTO['cubo']
+    filtros = dict(
+        rango_fechas=opciones['rango_fechas'],
+        monto_minimo=opciones['monto_minimo'],
+        regiones=corte['regiones'],
+        categorias=corte['categorias'],
+    )
+    _, df_filtrado = filtrar_dataset(df, indice, filtros)
+    totales, serie, utilidad, resumen = agregar_filtrados(cubo, filtros, df_filtrado)
+    if resumen is None and not df_filtrado.empty and 'Categoria' in df_filtrado.columns:
+        resumen = resumen_por_categoria(df_filtrado)
+
+    categorias = corte['categorias'] or opciones['categorias']
+    figuras = [
+        crear_grafico_lineas(df_filtrado, opciones['tema'], categorias, df_agrupado=serie,
+                             puntos_maximos=PUNTOS_GRAFICO),
+        crear_grafico_barras_categorias(df_filtrado, opciones['tema'], categorias, df_agrupado=utilidad),
+    ]
+
+    archivo = f"{nombre_archivo(opciones['nombre'])}_{nombre_archivo(corte['nombre'])}.{opciones['formato']}"
+    ruta = Path(opciones['salida']) / archivo
+    if opciones['formato'] == 'html':
+        contenido = renderizar_html(
+            opciones['nombre'], opciones['generado'], corte['nombre'], totales, figuras, resumen
+        )
+    else:
+        contenido = json.dumps({
+            'reporte': opciones['nombre'],
+            'generado': opciones['generado'],
+            'corte': corte['nombre'],
+            'filtros': filtros,
+            'totales': {clave: valor.item() if hasattr(valor, 'item') else valor for clave, valor in totales.items()},
+            'graficos': [json.loads(figura.to_json()) for figura in figuras],
+            'resumen': json.loads(resumen.to_json(orient='split')) if resumen is not None else None,
+        }, ensure_ascii=False, default=str)
+    ruta.write_text(contenido, encoding='utf-8')
+
+    return {
+        'corte': corte['nombre'],
+        'archivo': ruta.name,
+        'registros': int(totales['Registros']),
+        'segundos': round(time.perf_counter() - inicio, 4),
+    }
+
+def generar_reportes(df, cortes, opciones, max_procesos=None):
+    """Genera los reportes de todos los cortes en un pool de procesos y devuelve (generados, errores)"""
+    indice = IndiceFiltros(df)
+    cubo = CuboMensual(df) if admite_cubo_mensual(df) else None
+    opciones = dict(opciones, categorias=list(opciones_filtros(df).get('categorias', [])))
+
+    # Con fork los procesos heredan el dataset, el índice y el cubo sin copiarlos
+    metodo = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    generados, errores = [], []
+    with ProcessPoolExecutor(
+        max_workers=min(max_procesos or os.cpu_count() or 1, len(cortes)),
+        mp_context=multiprocessing.get_context(metodo),
+        initializer=iniciar_proceso,
+        initargs=(df, indice, cubo),
+    ) as pool:
+        futuros = {pool.submit(generar_reporte, corte, opciones): corte for corte in cortes}
+        for completados, futuro in enumerate(as_completed(futuros), start=1):
+            corte = futuros[futuro]
+            try:
+                generados.append(futuro.result())
+                estado = "✅"
+            except Exception as e:
+                errores.append({'corte': corte['nombre'], 'error': str(e)})
+                estado = "❌"
+            print(f"{estado} {corte['nombre']} ({completados}/{len(cortes)})")
+    return generados, errores
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera reportes del dashboard financiero sin Streamlit")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument('--datos', nargs='+', help="Archivos CSV/Excel con los datos (se unen en un solo dataset)")
+    origen.add_argument('--simulados', action='store_true', help="Usar datos simulados")
+    parser.add_argument('--meses', type=int, default=12, help="Meses de datos simulados")
+    parser.add_argument('--año', type=int, default=2024, help="Año de los datos simulados")
+    parser.add_argument('--semilla', type=int, default=42, help="Semilla de los datos simulados")
+    parser.add_argument('--salida', default='reportes', help="Directorio donde se escriben los reportes")
+    parser.add_argument('--nombre', default='Reporte Mensual', help="Nombre del reporte")
+    parser.add_argument('--formato', choices=FORMATOS_REPORTE, default='html', help="Formato de los reportes")
+    parser.add_argument('--por', choices=CORTES, default='region-categoria',
+                        help="Cortes a generar además del total")
+    parser.add_argument('--desde', help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument('--hasta', help="Fecha final (AAAA-MM-DD)")
+    parser.add_argument('--monto-minimo', type=float, default=0, help="Monto mínimo de ingresos")
+    parser.add_argument('--tema', choices=['Claro', 'Oscuro'], default='Claro', help="Tema de los gráficos")
+    parser.add_argument('--procesos', type=int, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    args = parser.parse_args(argumentos)
+
+    df = cargar_datos(args.datos, dict(meses=args.meses, año=args.año, semilla=args.semilla))
+    rango_fechas = None
+    if args.desde or args.hasta:
+        opciones = opciones_filtros(df)
+        rango_fechas = (
+            pd.Timestamp(args.desde) if args.desde else pd.Timestamp(opciones['fecha_min']),
+            pd.Timestamp(args.hasta) if args.hasta else pd.Timestamp(opciones['fecha_max']),
+        )
+
+    Path(args.salida).mkdir(parents=True, exist_ok=True)
+    generado = datetime.now().strftime('%Y/%m/%d %H:%M')
+    cortes = definir_cortes(df, args.por)
+    opciones = dict(
+        salida=args.salida, nombre=args.nombre, formato=args.formato, tema=args.tema,
+        generado=generado, rango_fechas=rango_fechas, monto_minimo=args.monto_minimo,
+    )
+    generados, errores = generar_reportes(df, cortes, opciones, args.procesos)
+
+    with open(Path(args.salida) / 'indice.json', 'w', encoding='utf-8') as archivo:
+        json.dump({
+            'reporte': args.nombre,
+            'generado': generado,
+            'registros': len(df),
+            'reportes': sorted(generados, key=lambda entrada: entrada['corte']),
+            'errores': errores,
+        }, archivo, indent=2, ensure_ascii=False)
+    print(f"{len(generados)} reportes generados en {args.salida} ({len(errores)} errores)")
+    return 1 if errores else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,64 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import io
+import os
+import gzip
+import hashlib
+import tempfile
+import threading
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from functools import partial, reduce
+from operator import and_
+from pathlib import Path
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from datos_financieros import (
+    FILTROS_DIMENSION,
+    FRECUENCIAS_SIMULACION,
+    NIVELES_TEMPORALES,
+    CuboMensual,
+    IndiceFiltros,
+    RollupsTemporales,
+    admite_cubo_mensual,
+    agregar_filtrados,
+    agrupar_por_nivel,
+    ajustar_a_periodos,
+    analizar_serie,
+    fechas_simuladas,
+    filtrar_dataset,
+    generar_datos_simulados,
+    indicadores_acumulados,
+    nivel_temporal_automatico,
+    opciones_filtros,
+    resumen_por_categoria,
+    seleccionar_celdas,
+)
+from graficos import (
+    INDICADORES_TENDENCIA,
+    METODOS_REDUCCION,
+    crear_grafico_barras_categorias,
+    crear_grafico_lineas,
+)
+from perfilado import Perfilador
+from ingesta_datos import (
+    procesar_archivo_csv,
+    leer_excel_con_cache,
+    listar_hojas_excel,
+    procesar_archivos_en_paralelo,
+    conciliar_esquemas,
+    anexar_datos,
+    memoria_dataset,
+    memoria_estructura,
+)
+
+try:
+    import duckdb
+except ImportError:  # DuckDB es un motor opcional
+    duckdb = None
+
 # --------------------
 # CONFIGURACIÓN GENERAL
 # --------------------
@@ -18,56 +71,764 @@ st.set_page_config(
 # --------------------
 # FUNCIONES AUXILIARES
 # --------------------
-def generar_datos_falsos(meses=12, año=2024):
-    """Genera un DataFrame con datos financieros ficticios"""
-    fechas = pd.date_range(start=f"{año}-01-01", periods=meses, freq='M')
-    
-    # Añadir más categorías y variabilidad
-    categorias = ['Ventas', 'Servicios', 'Consultoría', 'Productos']
-    departamentos = ['Marketing', 'Operaciones', 'RRHH', 'IT', 'Administración']
-    
-    data = []
-    for fecha in fechas:
-        for categoria in categorias:
-            ingreso = np.random.randint(2000, 8000)
-            egreso = np.random.randint(1000, 6000)
-            data.append({
-                'Fecha': fecha,
-                'Categoria': categoria,
-                'Departamento': np.random.choice(departamentos),
-                'Ingresos': ingreso,
-                'Egresos': egreso,
-                'Utilidad': ingreso - egreso,
-                'Region': np.random.choice(['Norte', 'Sur', 'Centro', 'Oriente'])
-            })
-    
-    return pd.DataFrame(data)
-
-def procesar_archivo_csv(uploaded_file):
-    """Procesa archivo CSV subido por el usuario y calcula la utilidad"""
-    try:
-        # Leer el archivo
-        df = pd.read_csv(uploaded_file)
-
-        # Intentar detectar columnas de fecha
-        date_columns = df.select_dtypes(include=['object']).columns
-        for col in date_columns:
-            try:
-                df[col] = pd.to_datetime(df[col])
-                break  # Usar la primera columna que se pueda convertir
-            except:
-                continue
-
-        # Verificar si existen las columnas necesarias para calcular utilidad
-        if 'Ingresos' in df.columns and 'Egresos' in df.columns:
-            df['Utilidad'] = df['Ingresos'] - df['Egresos']
+class CacheLRU:
+    """Caché LRU acotada por número de entradas y memoria, con contadores de aciertos y fallos"""
+
+    def __init__(self, max_entradas=8, max_bytes=None):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._tamaños = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """Devuelve el valor asociado a la clave (o None) y lo marca como usado recientemente"""
+        with self._lock:
+            if clave not in self._entradas:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return self._entradas[clave]
+
+    def guardar(self, clave, valor, tamaño=0):
+        """Guarda un valor y expulsa las entradas menos usadas si se superan los límites"""
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            self._tamaños[clave] = tamaño
+            while len(self._entradas) > 1 and (
+                len(self._entradas) > self.max_entradas
+                or (self.max_bytes is not None and sum(self._tamaños.values()) > self.max_bytes)
+            ):
+                clave_antigua, _ = self._entradas.popitem(last=False)
+                del self._tamaños[clave_antigua]
+
+    def estadisticas(self):
+        """Resumen del estado de la caché"""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': sum(self._tamaños.values()),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+class RegistroDatasets(CacheLRU):
+    """Datasets cargados una sola vez por proceso y compartidos entre todas las sesiones.
+
+    Cada sesión retiene las claves que usa durante un rerun y las confirma al terminar la carga;
+    las que dejó de usar se sueltan. Al superar `max_bytes` se expulsan primero los datasets
+    menos usados que ninguna sesión activa retiene: expulsar uno en uso no libera memoria (la
+    sesión conserva su referencia) y al recargarlo habría dos copias. Los valores se comparten
+    sin copiarse, así que no deben modificarse in situ.
+    """
+
+    def __init__(self, max_bytes=None, sesion_activa=None):
+        super().__init__(max_entradas=None, max_bytes=max_bytes)
+        self.sesion_activa = sesion_activa
+        self._referencias = {}  # Sesión -> claves confirmadas en su último rerun completo
+        self._pendientes = {}   # Sesión -> claves usadas en el rerun en curso
+        self._detalles = {}
+        self._cargas = {}
+
+    def obtener(self, clave):
+        valor = super().obtener(clave)
+        if valor is not None:
+            with self._lock:
+                self._detalles[clave]['ultimo_uso'] = datetime.now()
+        return valor
+
+    def guardar(self, clave, valor, tamaño=0, descripcion=''):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            self._tamaños[clave] = tamaño
+            ahora = datetime.now()
+            self._detalles[clave] = {'descripcion': descripcion, 'cargado': ahora, 'ultimo_uso': ahora}
+            self._expulsar(conservar=clave)
+
+    def obtener_o_cargar(self, clave, sesion, cargar, descripcion=''):
+        """Valor de `clave` retenido por `sesion`, cargándolo con `cargar()` si no está registrado.
+
+        `cargar` devuelve (valor, tamaño en bytes); con tamaño None el valor no se registra
+        (p. ej. un error de lectura). Las cargas simultáneas de una clave esperan a la primera.
+        """
+        with self._lock:
+            self._pendientes.setdefault(sesion, set()).add(clave)
+            carga = self._cargas.setdefault(clave, threading.Lock())
+        with carga:
+            valor = self.obtener(clave)
+            if valor is None:
+                valor, tamaño = cargar()
+                if tamaño is not None:
+                    self.guardar(clave, valor, tamaño, descripcion)
+        return valor
+
+    def iniciar_rerun(self, sesion):
+        """Empieza a registrar las claves que usa `sesion` (las confirmadas siguen retenidas)"""
+        with self._lock:
+            self._pendientes[sesion] = set()
+
+    def confirmar_rerun(self, sesion):
+        """Deja a `sesion` reteniendo solo las claves que usó en lo que va del rerun.
+
+        Se puede llamar más de una vez por rerun (p. ej. tras cargar los datos y tras construir
+        sus estructuras derivadas): cada llamada confirma todo lo usado desde iniciar_rerun.
+        """
+        with self._lock:
+            self._referencias[sesion] = set(self._pendientes.get(sesion, set()))
+            self._expulsar()
+
+    def liberar_sin_uso(self):
+        """Expulsa todos los datasets que ninguna sesión activa retiene; devuelve cuántos"""
+        with self._lock:
+            sesiones = self._contar_sesiones()
+            sin_uso = [clave for clave in self._entradas if not sesiones.get(clave)]
+            for clave in sin_uso:
+                self._quitar(clave)
+            return len(sin_uso)
+
+    def estadisticas(self):
+        estadisticas = super().estadisticas()
+        with self._lock:
+            self._contar_sesiones()
+            estadisticas['sesiones'] = len(self._referencias.keys() | self._pendientes.keys())
+        estadisticas['max_bytes'] = self.max_bytes
+        return estadisticas
+
+    def inventario(self):
+        """Un registro por dataset residente: descripción, tamaño, sesiones que lo usan y fechas"""
+        with self._lock:
+            sesiones = self._contar_sesiones()
+            return [
+                {
+                    'dataset': self._detalles[clave]['descripcion'],
+                    'MB': round(self._tamaños[clave] / 1024 ** 2, 2),
+                    'sesiones': sesiones.get(clave, 0),
+                    'cargado': self._detalles[clave]['cargado'],
+                    'último uso': self._detalles[clave]['ultimo_uso'],
+                }
+                for clave in reversed(self._entradas)
+            ]
+
+    def _contar_sesiones(self):
+        """Sesiones activas que retienen cada clave (descarta las sesiones cerradas)"""
+        if self.sesion_activa is not None:
+            for registro in (self._referencias, self._pendientes):
+                for sesion in [sesion for sesion in registro if not self.sesion_activa(sesion)]:
+                    del registro[sesion]
+        conteo = {}
+        for sesion in self._referencias.keys() | self._pendientes.keys():
+            for clave in self._referencias.get(sesion, set()) | self._pendientes.get(sesion, set()):
+                conteo[clave] = conteo.get(clave, 0) + 1
+        return conteo
+
+    def _expulsar(self, conservar=None):
+        if self.max_bytes is None:
+            return
+        sesiones = self._contar_sesiones()
+        total = sum(self._tamaños.values())
+        for clave in list(self._entradas):
+            if total <= self.max_bytes:
+                break
+            if clave != conservar and not sesiones.get(clave):
+                total -= self._quitar(clave)
+
+    def _quitar(self, clave):
+        del self._entradas[clave]
+        del self._detalles[clave]
+        self._cargas.pop(clave, None)
+        return self._tamaños.pop(clave)
+
+# Directorio para los archivos Excel convertidos a Parquet
+DIRECTORIO_CACHE = os.environ.get(
+    'DASHBOARD_DIRECTORIO_CACHE', os.path.join(tempfile.gettempdir(), 'dashboard_financiero_cache')
+)
+
+# Memoria máxima de los datasets compartidos y sus estructuras derivadas (índices, cubos, rollups,
+# motores DuckDB); los que están en uso no se expulsan aunque se supere
+MEMORIA_MAXIMA_DATASETS = int(os.environ.get('DASHBOARD_MEMORIA_DATASETS_MB', 2048)) * 1024 ** 2
+
+# Tope de filas de los datos simulados (períodos × registros por período): todas las sesiones
+# comparten el proceso, así que no debe superar lo que cabe en MEMORIA_MAXIMA_DATASETS contando
+# el DataFrame (~23 bytes por fila) y sus índices, cubo y rollups (~42 bytes por fila)
+BYTES_POR_FILA_SIMULADA = 64
+MAX_FILAS_SIMULADAS = min(20_000_000, MEMORIA_MAXIMA_DATASETS // BYTES_POR_FILA_SIMULADA)
+
+def sesion_activa(id_sesion):
+    """Indica si la sesión sigue conectada al servidor"""
+    return not runtime.exists() or runtime.get_instance().is_active_session(id_sesion)
+
+@st.cache_resource
+def obtener_registro_datasets():
+    """Registro de datasets compartido por todas las sesiones del servidor"""
+    return RegistroDatasets(max_bytes=MEMORIA_MAXIMA_DATASETS, sesion_activa=sesion_activa)
+
+def id_sesion():
+    """Identificador de la sesión del rerun en curso"""
+    contexto = get_script_run_ctx()
+    return contexto.session_id if contexto is not None else 'local'
+
+def obtener_derivado(clave, construir, descripcion, medir=memoria_estructura):
+    """Estructura derivada de un dataset (índice, cubo, rollups, motor...) en el registro de datasets.
+
+    Así cuenta para el presupuesto de memoria, aparece en la vista de administración y la sesión
+    que la usa la retiene como a sus datasets. `construir()` puede devolver None (no se registra).
+    """
+    def cargar():
+        valor = construir()
+        return valor, (medir(valor) if valor is not None else None)
+
+    return obtener_registro_datasets().obtener_o_cargar(clave, id_sesion(), cargar, descripcion)
+
+def generar_datos_falsos(**parametros):
+    """Datos simulados (ver generar_datos_simulados) compartidos entre sesiones: no deben modificarse in situ"""
+    def generar():
+        with st.spinner("Generando datos simulados..."):
+            df = generar_datos_simulados(**parametros)
+        return df, memoria_dataset(df)
+
+    clave = ('simulados', tuple(sorted(parametros.items())))
+    descripcion = "Simulados: " + ", ".join(f"{nombre}={valor}" for nombre, valor in sorted(parametros.items()))
+    return obtener_registro_datasets().obtener_o_cargar(clave, id_sesion(), generar, descripcion)
+
+def calcular_hash_archivo(uploaded_file):
+    """Calcula el hash SHA-256 del contenido del archivo (una sola vez por archivo subido)"""
+    hashes = st.session_state.setdefault('hashes_archivos', {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return hashes[uploaded_file.file_id]
+
+@st.cache_data(max_entries=16)
+def obtener_hojas_excel(hash_contenido, _uploaded_file):
+    """Hojas del archivo Excel con el hash indicado"""
+    return listar_hojas_excel(_uploaded_file)
+
+def clave_archivo(uploaded_file, opciones):
+    """Identifica un archivo procesado: hash del contenido, tipo de archivo y opciones de lectura"""
+    es_csv = uploaded_file.name.endswith('.csv')
+    return (calcular_hash_archivo(uploaded_file), es_csv, tuple(sorted(opciones.items())))
+
+def cargar_archivo(uploaded_file, progreso=None, **opciones):
+    """Procesa el archivo subido reutilizando el resultado si el mismo contenido ya se procesó.
+
+    Las `opciones` de lectura forman parte de la clave del registro. El DataFrame devuelto
+    se comparte entre reruns y sesiones: no debe modificarse in situ.
+    """
+    def procesar():
+        uploaded_file.seek(0)
+        if uploaded_file.name.endswith('.csv'):
+            df, error = procesar_archivo_csv(uploaded_file, progreso=progreso, **opciones)
+        else:
+            df, error = leer_excel_con_cache(
+                uploaded_file, calcular_hash_archivo(uploaded_file), DIRECTORIO_CACHE, **opciones
+            )
+        return (df, error), (memoria_dataset(df) if error is None else None)
+
+    return obtener_registro_datasets().obtener_o_cargar(
+        clave_archivo(uploaded_file, opciones), id_sesion(), procesar, uploaded_file.name
+    )
+
+def obtener_indice_filtros(clave_dataset, df, anexo=None):
+    """Índices de filtrado del dataset identificado por `clave_dataset` (uno por dataset).
+
+    Si el dataset resulta de anexar filas a otro (`anexo` = (clave_base, df_base, conservadas,
+    periodos)), se extiende el índice del dataset base en lugar de construirlo de cero.
+    """
+    def construir():
+        if anexo is not None:
+            clave_base, df_base, conservadas, _ = anexo
+            return obtener_indice_filtros(clave_base, df_base).anexar(df, conservadas)
+        return IndiceFiltros(df)
+
+    return obtener_derivado(('indice', clave_dataset), construir, f"Índice de filtros ({len(df):,} filas)")
+
+def obtener_cubo_mensual(clave_dataset, df, anexo=None):
+    """Cubo de agregados mensuales del dataset, o None si no tiene las columnas necesarias.
+
+    Con `anexo` (ver obtener_indice_filtros) solo se recalculan los meses afectados del cubo base.
+    """
+    if not admite_cubo_mensual(df):
+        return None
+
+    def construir():
+        if anexo is not None:
+            clave_base, df_base, _, periodos = anexo
+            cubo_base = obtener_cubo_mensual(clave_base, df_base)
+            if cubo_base is not None:
+                return cubo_base.actualizar(df, periodos)
+        return CuboMensual(df)
+
+    return obtener_derivado(('cubo', clave_dataset), construir, f"Cubo mensual ({len(df):,} filas)")
+
+def obtener_rollups_temporales(clave_dataset, df, anexo=None):
+    """Agregados por nivel temporal del dataset, o None si no tiene las columnas necesarias.
+
+    Con `anexo` (ver obtener_indice_filtros) solo se reagrupan los días de los meses afectados.
+    """
+    if not admite_cubo_mensual(df):
+        return None
+
+    def construir():
+        if anexo is not None:
+            clave_base, df_base, _, periodos = anexo
+            rollups_base = obtener_rollups_temporales(clave_base, df_base)
+            if rollups_base is not None:
+                return rollups_base.actualizar(df, periodos)
+        return RollupsTemporales(df)
+
+    return obtener_derivado(('rollups', clave_dataset), construir, f"Rollups temporales ({len(df):,} filas)")
+
+# Tabla paginada de datos
+TAMAÑOS_PAGINA = [25, 50, 100, 500]
+COLUMNAS_MONETARIAS = ['Ingresos', 'Egresos', 'Utilidad']
+
+def ordenar_posiciones(serie, descendente=False):
+    """Orden estable de las posiciones de la serie (nulos al final, categóricas alfabéticamente)"""
+    serie = serie.reset_index(drop=True)
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.cat.reorder_categories(sorted(serie.cat.categories, key=str))
+    return serie.sort_values(ascending=not descendente, kind='stable', na_position='last').index.to_numpy()
+
+def configurar_columnas_tabla(df):
+    """Formato de las columnas para st.dataframe, aplicado en el navegador en lugar de un Styler"""
+    configuracion = {}
+    for col in df.columns:
+        if col == 'Fecha' and pd.api.types.is_datetime64_any_dtype(df[col]):
+            configuracion[col] = st.column_config.DatetimeColumn(col, format="YYYY/MM/DD")
+        elif col in COLUMNAS_MONETARIAS and pd.api.types.is_numeric_dtype(df[col]):
+            configuracion[col] = st.column_config.NumberColumn(col, format="dollar")
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            configuracion[col] = st.column_config.NumberColumn(col, format="localized")
+    return configuracion
+
+def obtener_cache_sesion(nombre, max_entradas=4):
+    """CacheLRU guardada en el estado de la sesión actual"""
+    if nombre not in st.session_state:
+        st.session_state[nombre] = CacheLRU(max_entradas=max_entradas)
+    return st.session_state[nombre]
+
+def congelar_filtros(filtros):
+    """Filtros como tupla ordenada y hashable para usarlos en claves de caché"""
+    return tuple(
+        (nombre, tuple(valor) if isinstance(valor, list) else valor)
+        for nombre, valor in sorted(filtros.items())
+    )
+
+def memorizar(nombre_cache, clave, construir):
+    """Valor memorizado para `clave` en la caché de sesión `nombre_cache`; si no está, se calcula con `construir()`"""
+    cache = obtener_cache_sesion(nombre_cache, max_entradas=8)
+    valor = cache.obtener(clave)
+    if valor is None:
+        valor = construir()
+        cache.guardar(clave, valor)
+    return valor
+
+def memorizar_grafico(clave, construir):
+    """Figura memorizada en la sesión para `clave`; si no está, se construye con `construir()`.
+
+    Así los reruns provocados por widgets ajenos a los gráficos no vuelven a agrupar, reducir
+    ni construir las figuras.
+    """
+    return memorizar('cache_graficos', clave, construir)
+
+def memorizar_serie(clave, construir):
+    """Serie por periodo memorizada en la sesión: cambiar ventanas o indicadores no vuelve a agregarla"""
+    return memorizar('cache_series', clave, construir)
+
+# Exportación de datos filtrados: formato -> (extensión, tipo MIME)
+FORMATOS_EXPORTACION = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV comprimido (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+LIMITE_FILAS_EXCEL = 200_000
+FILAS_POR_BLOQUE_EXPORTACION = 100_000
+
+def exportar_datos(df, posiciones, formato, destino):
+    """Escribe por bloques las filas `posiciones` de df en el archivo binario `destino`"""
+    bloques = (
+        df.take(posiciones[inicio:inicio + FILAS_POR_BLOQUE_EXPORTACION])
+        for inicio in range(0, max(len(posiciones), 1), FILAS_POR_BLOQUE_EXPORTACION)
+    )
+
+    if formato == 'Excel':
+        if len(posiciones) > LIMITE_FILAS_EXCEL:
+            raise ValueError(f"Excel admite hasta {LIMITE_FILAS_EXCEL:,} registros en la exportación")
+        df.take(posiciones).to_excel(destino, index=False)
+    elif formato == 'Parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        escritor = None
+        for bloque in bloques:
+            tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabla.schema)
+            escritor.write_table(tabla)
+        escritor.close()
+    else:
+        comprimido = formato == 'CSV comprimido (gzip)'
+        binario = gzip.GzipFile(fileobj=destino, mode='wb') if comprimido else destino
+        texto = io.TextIOWrapper(binario, encoding='utf-8', newline='')
+        for i, bloque in enumerate(bloques):
+            bloque.to_csv(texto, header=i == 0, index=False)
+        texto.flush()
+        texto.detach()
+        if comprimido:
+            binario.close()
+
+def generar_exportacion(df, posiciones, formato):
+    """Genera la exportación en un archivo temporal y devuelve su contenido (se llama al descargar)"""
+    with tempfile.TemporaryFile() as destino:
+        exportar_datos(df, posiciones, formato, destino)
+        destino.seek(0)
+        return destino.read()
+
+def generar_exportacion_duckdb(motor, filtros, formato):
+    """Como generar_exportacion, pero escribiendo desde SQL las filas que cumplen `filtros`"""
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, f"exportacion.{FORMATOS_EXPORTACION[formato][0]}")
+        motor.exportar(formato, ruta, **filtros)
+        with open(ruta, 'rb') as archivo:
+            return archivo.read()
+
+# Almacén columnar en disco: particiones hive por año y mes (p. ej. año=2024/mes=1/datos.parquet)
+COLUMNAS_DATOS = ['Fecha', 'Categoria', 'Departamento', 'Region', 'Ingresos', 'Egresos', 'Utilidad']
+PARTICIONES_AÑO = ['año', 'anio', 'year']
+PARTICIONES_MES = ['mes', 'month']
+EXTENSIONES_COLUMNARES = {'.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+
+def firma_directorio(directorio):
+    """Archivos columnares del directorio con tamaño y fecha de modificación (cambia si cambian los datos)"""
+    if not os.path.isdir(directorio):
+        return ()
+    archivos = sorted(ruta for ruta in Path(directorio).rglob('*') if ruta.suffix in EXTENSIONES_COLUMNARES)
+    return tuple((str(ruta), ruta.stat().st_size, ruta.stat().st_mtime_ns) for ruta in archivos)
+
+@st.cache_resource(max_entries=4)
+def abrir_dataset_columnar(directorio, firma):
+    """Abre el directorio como pyarrow.dataset con particiones hive y lectura por memoria mapeada"""
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+
+    formato = EXTENSIONES_COLUMNARES[Path(firma[0][0]).suffix]
+    return ds.dataset(
+        directorio,
+        format=formato,
+        partitioning='hive',
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=True
+    )
+
+@st.cache_resource(max_entries=4, show_spinner="Leyendo catálogo del directorio...")
+def leer_catalogo_columnar(directorio, firma):
+    """Opciones de filtrado del dataset columnar leyendo solo la fecha y las dimensiones"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    dataset = abrir_dataset_columnar(directorio, firma)
+    columnas = [col for col in ['Fecha'] + list(FILTROS_DIMENSION.values()) if col in dataset.schema.names]
+    tabla = dataset.to_table(columns=columnas)
+
+    opciones = {}
+    if 'Categoria' in columnas:
+        opciones['categorias'] = pc.unique(tabla['Categoria'].combine_chunks()).to_pylist()
+    # Una Fecha guardada como texto no ofrece filtro de rango, como en los archivos subidos
+    if 'Fecha' in columnas and tabla.num_rows > 0 and pa.types.is_temporal(tabla.schema.field('Fecha').type):
+        extremos = pc.min_max(tabla['Fecha'])
+        opciones['fecha_min'] = pd.Timestamp(extremos['min'].as_py()).date()
+        opciones['fecha_max'] = pd.Timestamp(extremos['max'].as_py()).date()
+    for nombre in ['regiones', 'departamentos']:
+        if FILTROS_DIMENSION[nombre] in columnas:
+            opciones[nombre] = pc.unique(tabla[FILTROS_DIMENSION[nombre]].combine_chunks()).to_pylist()
+    return opciones
+
+def leer_dataset_columnar(directorio, firma, rango_fechas=None, categorias=None):
+    """Lectura del directorio (ver leer_particiones_columnares) compartida en el registro de datasets.
+
+    El DataFrame se comparte entre reruns y sesiones: no debe modificarse in situ.
+    """
+    def leer():
+        with st.spinner("Leyendo particiones..."):
+            df = leer_particiones_columnares(directorio, firma, rango_fechas, categorias)
+        return df, memoria_dataset(df)
+
+    clave = ('columnar', directorio, firma, rango_fechas, tuple(categorias) if categorias is not None else None)
+    descripcion = f"Directorio {directorio}" + (f" del {rango_fechas[0]} al {rango_fechas[1]}" if rango_fechas else "")
+    return obtener_registro_datasets().obtener_o_cargar(clave, id_sesion(), leer, descripcion)
+
+def leer_particiones_columnares(directorio, firma, rango_fechas=None, categorias=None):
+    """Lee del directorio solo las columnas y particiones necesarias para el rango y las categorías.
+
+    El rango de fechas poda las particiones año/mes y filtra por Fecha; las categorías se filtran
+    en la lectura.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = abrir_dataset_columnar(directorio, firma)
+    nombres = dataset.schema.names
+    condiciones = []
+
+    if rango_fechas is not None and 'Fecha' in nombres:
+        inicio = pd.Timestamp(rango_fechas[0])
+        ultimo_dia = pd.Timestamp(rango_fechas[1])
+        fin = ultimo_dia + pd.Timedelta(days=1)
+        tipo_fecha = dataset.schema.field('Fecha').type
+        if pa.types.is_timestamp(tipo_fecha):
+            limites = pa.scalar(inicio.to_pydatetime(), type=tipo_fecha), pa.scalar(fin.to_pydatetime(), type=tipo_fecha)
         else:
-            missing = [col for col in ['Ingresos', 'Costos'] if col not in df.columns]
-            return None, f"Faltan columnas necesarias para calcular utilidad: {missing}"
+            limites = pa.scalar(inicio.date(), type=tipo_fecha), pa.scalar(fin.date(), type=tipo_fecha)
+        condiciones += [ds.field('Fecha') >= limites[0], ds.field('Fecha') < limites[1]]
+
+        # Poda de particiones: solo se abren los archivos de los años/meses del rango
+        año = next((col for col in PARTICIONES_AÑO if col in nombres), None)
+        mes = next((col for col in PARTICIONES_MES if col in nombres), None)
+        if año and mes:
+            condiciones += [
+                (ds.field(año) > inicio.year) | ((ds.field(año) == inicio.year) & (ds.field(mes) >= inicio.month)),
+                (ds.field(año) < ultimo_dia.year) | ((ds.field(año) == ultimo_dia.year) & (ds.field(mes) <= ultimo_dia.month)),
+            ]
+        elif año:
+            condiciones += [ds.field(año) >= inicio.year, ds.field(año) <= ultimo_dia.year]
+
+    if categorias is not None and 'Categoria' in nombres:
+        condiciones.append(ds.field('Categoria').isin(list(categorias)))
+
+    tabla = dataset.to_table(
+        columns=[col for col in COLUMNAS_DATOS if col in nombres],
+        filter=reduce(and_, condiciones) if condiciones else None
+    )
+    df = tabla.to_pandas()
+    if 'Utilidad' not in df.columns and 'Ingresos' in df.columns and 'Egresos' in df.columns:
+        df['Utilidad'] = df['Ingresos'] - df['Egresos']
+    return df
+
+# Motores de consulta para filtros y agregaciones
+MOTOR_PANDAS = "pandas"
+MOTOR_DUCKDB = "DuckDB"
+UNIDADES_DUCKDB = {'Día': 'day', 'Semana': 'week', 'Mes': 'month', 'Trimestre': 'quarter', 'Año': 'year'}
+
+class MotorDuckDB:
+    """Motor de consultas DuckDB embebido: filtros y agregaciones se ejecutan como SQL.
+
+    Consulta el DataFrame cargado (registrado sin copiarlo) o un pyarrow.dataset de un directorio
+    columnar, usando todos los núcleos y desbordando a disco si los datos no caben en memoria.
+    """
+
+    def __init__(self, origen, limite_memoria=None):
+        self._lock = threading.Lock()
+        self.conexion = duckdb.connect(database=':memory:')
+        directorio_temporal = os.path.join(tempfile.gettempdir(), 'duckdb_dashboard')
+        self.conexion.execute(f"SET temp_directory = '{directorio_temporal}'")
+        if limite_memoria:
+            self.conexion.execute(f"SET memory_limit = '{limite_memoria}'")
+
+        self.conexion.register('origen', origen)
+        tipos_origen = {fila[0]: fila[1] for fila in self.conexion.execute("DESCRIBE origen").fetchall()}
+        self.columnas = [col for col in COLUMNAS_DATOS if col in tipos_origen]
+        # Como en pandas, una Fecha que quedó como texto no admite rangos ni niveles temporales
+        self.fecha_temporal = tipos_origen.get('Fecha', '').startswith(('DATE', 'TIMESTAMP'))
+        seleccion = ', '.join(f'"{col}"' for col in self.columnas)
+        if 'Utilidad' not in self.columnas and {'Ingresos', 'Egresos'} <= set(self.columnas):
+            seleccion += ', "Ingresos" - "Egresos" AS "Utilidad"'
+            self.columnas.append('Utilidad')
+        self.conexion.execute(f"CREATE VIEW datos AS SELECT {seleccion} FROM origen")
+        self._dias = None
+
+    def memoria(self):
+        """Bytes que ocupan los buffers de DuckDB (no incluye el DataFrame registrado)"""
+        with self._lock:
+            return int(self.conexion.execute("SELECT COALESCE(SUM(memory_usage_bytes), 0) FROM duckdb_memory()").fetchone()[0])
+
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return self.conexion.execute(sql, list(parametros)).df()
+
+    def _where(self, rango_fechas=None, monto_minimo=None, solo_positivas=False, **selecciones):
+        """Cláusula WHERE y parámetros equivalentes a IndiceFiltros.filtrar.
+
+        `solo_positivas` deja además solo las filas con Utilidad mayor que cero (opción de la tabla).
+        """
+        condiciones, parametros = [], []
+        if solo_positivas and 'Utilidad' in self.columnas:
+            condiciones.append('"Utilidad" > 0')
+        if rango_fechas is not None and self.fecha_temporal:
+            condiciones.append('"Fecha" >= ? AND "Fecha" < ?')
+            parametros += [
+                pd.Timestamp(rango_fechas[0]).to_pydatetime(),
+                (pd.Timestamp(rango_fechas[1]) + pd.Timedelta(days=1)).to_pydatetime(),
+            ]
+        if monto_minimo is not None and 'Ingresos' in self.columnas:
+            condiciones.append('"Ingresos" >= ?')
+            parametros.append(monto_minimo)
+        for nombre, valores in selecciones.items():
+            columna = FILTROS_DIMENSION[nombre]
+            if valores is not None and columna in self.columnas:
+                condiciones.append(f'list_contains(?::VARCHAR[], "{columna}"::VARCHAR)')
+                parametros.append([str(valor) for valor in valores])
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        return where, parametros
+
+    def pagina(self, inicio, cantidad, columna_orden=None, descendente=False, **filtros):
+        """Filas [inicio, inicio + cantidad) de las que cumplen los filtros, ordenadas en SQL.
+
+        Sin `columna_orden` se conserva el orden de los datos; los valores nulos van al final.
+        """
+        where, parametros = self._where(**filtros)
+        orden = f' ORDER BY "{columna_orden}" {"DESC" if descendente else "ASC"} NULLS LAST' if columna_orden else ''
+        return self._consultar(
+            f"SELECT * FROM datos{where}{orden} LIMIT ? OFFSET ?",
+            parametros + [int(cantidad), int(inicio)]
+        )
+
+    def exportar(self, formato, destino, **filtros):
+        """Escribe las filas que cumplen los filtros en el archivo `destino` (ruta) sin pasar por pandas.
+
+        CSV y Parquet se escriben con COPY; Excel necesita un DataFrame, así que se limita a
+        LIMITE_FILAS_EXCEL registros.
+        """
+        where, parametros = self._where(**filtros)
+        if formato == 'Excel':
+            df = self._consultar(f"SELECT * FROM datos{where} LIMIT ?", parametros + [LIMITE_FILAS_EXCEL + 1])
+            if len(df) > LIMITE_FILAS_EXCEL:
+                raise ValueError(f"Excel admite hasta {LIMITE_FILAS_EXCEL:,} registros en la exportación")
+            df.to_excel(destino, index=False)
+            return
+        opciones = {
+            'CSV': "FORMAT CSV, HEADER",
+            'CSV comprimido (gzip)': "FORMAT CSV, HEADER, COMPRESSION gzip",
+            'Parquet': "FORMAT PARQUET",
+        }[formato]
+        with self._lock:
+            self.conexion.execute(
+                f"COPY (SELECT * FROM datos{where}) TO '{destino}' ({opciones})", parametros
+            )
+
+    def dias_con_datos(self):
+        """Días (sin hora) con registros en todo el dataset, o None si Fecha no es una fecha"""
+        if not self.fecha_temporal:
+            return None
+        if self._dias is None:
+            dias = self._consultar(
+                "SELECT DISTINCT date_trunc('day', \"Fecha\") AS \"Dia\" FROM datos "
+                "WHERE \"Fecha\" IS NOT NULL ORDER BY 1"
+            )
+            self._dias = pd.to_datetime(dias['Dia']).to_numpy(dtype='datetime64[ns]')
+        return self._dias
+
+    def totales(self, **filtros):
+        """Totales de Ingresos y Egresos y número de registros"""
+        where, parametros = self._where(**filtros)
+        medidas = [col for col in ['Ingresos', 'Egresos'] if col in self.columnas]
+        sumas = ''.join(f'COALESCE(SUM("{col}"), 0) AS "{col}", ' for col in medidas)
+        with self._lock:
+            fila = self.conexion.execute(f"SELECT {sumas}COUNT(*) FROM datos{where}", parametros).fetchone()
+        return dict(zip(medidas + ['Registros'], fila))
+
+    def serie_temporal(self, nivel=None, **filtros):
+        """Ingresos y Egresos sumados por Fecha, o por inicio de periodo del `nivel` temporal.
+
+        Si Fecha no es una fecha se ignora el nivel y se agrupa por sus valores originales.
+        """
+        where, parametros = self._where(**filtros)
+        fecha = f"date_trunc('{UNIDADES_DUCKDB[nivel]}', \"Fecha\")" if nivel and self.fecha_temporal else '"Fecha"'
+        return self._consultar(
+            f'SELECT {fecha} AS "Fecha", SUM("Ingresos") AS "Ingresos", SUM("Egresos") AS "Egresos" '
+            f'FROM datos{where} GROUP BY 1 ORDER BY 1',
+            parametros
+        )
+
+    def utilidad_por_categoria(self, **filtros):
+        """Utilidad total por categoría"""
+        where, parametros = self._where(**filtros)
+        return self._consultar(
+            f'SELECT "Categoria", SUM("Utilidad") AS "Utilidad" '
+            f'FROM datos{where} GROUP BY "Categoria" ORDER BY "Categoria"',
+            parametros
+        )
+
+    def resumen_categoria(self, **filtros):
+        """Resumen por categoría con la misma forma que el groupby de pandas"""
+        where, parametros = self._where(**filtros)
+        df = self._consultar(
+            f'SELECT "Categoria", '
+            f'SUM("Ingresos") AS i_sum, AVG("Ingresos") AS i_mean, COUNT("Ingresos") AS i_count, '
+            f'SUM("Egresos") AS e_sum, AVG("Egresos") AS e_mean, '
+            f'SUM("Utilidad") AS u_sum, AVG("Utilidad") AS u_mean '
+            f'FROM datos{where} GROUP BY "Categoria" ORDER BY "Categoria"',
+            parametros
+        ).set_index('Categoria')
+        df.columns = pd.MultiIndex.from_tuples([
+            ('Ingresos', 'sum'), ('Ingresos', 'mean'), ('Ingresos', 'count'),
+            ('Egresos', 'sum'), ('Egresos', 'mean'),
+            ('Utilidad', 'sum'), ('Utilidad', 'mean'),
+        ])
+        return df.round(2)
+
+def obtener_motor_duckdb(clave_dataset, origen):
+    """Motor DuckDB del dataset identificado por `clave_dataset` (DataFrame o pyarrow.dataset).
 
-        return df, None
-    except Exception as e:
-        return None, str(e)
+    El motor mantiene registrado el DataFrame de origen, así que su tamaño lo incluye: expulsar
+    solo el dataset no liberaría esa memoria mientras el motor siga en el registro.
+    """
+    def medir(motor):
+        return motor.memoria() + (memoria_dataset(origen) if isinstance(origen, pd.DataFrame) else 0)
+
+    return obtener_derivado(
+        ('duckdb', clave_dataset),
+        lambda: MotorDuckDB(origen, limite_memoria=os.environ.get('DASHBOARD_DUCKDB_MEMORIA')),
+        "Motor DuckDB" + (f" ({len(origen):,} filas)" if isinstance(origen, pd.DataFrame) else " (directorio columnar)"),
+        medir=medir
+    )
+
+def clave_archivos(uploaded_files, opciones):
+    """Identifica un conjunto de archivos procesados y unidos en un solo dataset"""
+    # Los Excel solo usan las opciones de fecha
+    opciones_excel = {clave: valor for clave, valor in opciones.items() if clave != 'por_bloques'}
+    return tuple(
+        clave_archivo(archivo, opciones if archivo.name.endswith('.csv') else opciones_excel)
+        for archivo in uploaded_files
+    )
+
+def cargar_archivos(uploaded_files, opciones, progreso=None):
+    """Procesa varios archivos en paralelo y los une, reutilizando el resultado si ya se procesaron.
+
+    Devuelve (DataFrame o None, errores por archivo, avisos de la conciliación de esquemas).
+    """
+    def procesar():
+        archivos, vistos = [], {}
+        for archivo in uploaded_files:
+            # Nombres repetidos (p. ej. de carpetas distintas) se distinguen con un sufijo
+            vistos[archivo.name] = vistos.get(archivo.name, 0) + 1
+            base, extension = os.path.splitext(archivo.name)
+            nombre = archivo.name if vistos[archivo.name] == 1 else f"{base} ({vistos[archivo.name]}){extension}"
+            archivos.append((nombre, archivo.getvalue()))
+        dataframes, errores = procesar_archivos_en_paralelo(archivos, opciones, progreso=progreso)
+        if not dataframes:
+            return (None, errores, []), None
+
+        df, avisos = conciliar_esquemas(dataframes)
+        return (df, errores, avisos), memoria_dataset(df)
+
+    clave = ('varios',) + clave_archivos(uploaded_files, opciones)
+    descripcion = f"{len(uploaded_files)} archivos: " + ", ".join(archivo.name for archivo in uploaded_files)
+    return obtener_registro_datasets().obtener_o_cargar(clave, id_sesion(), procesar, descripcion)
+
+def anexar_dataset(clave_base, clave_nuevos, claves, df_base, df_nuevo, descripcion=''):
+    """Dataset base con las filas nuevas anexadas (ver anexar_datos), uno por combinación"""
+    def anexar():
+        with st.spinner("Anexando nuevos periodos..."):
+            resultado = anexar_datos(df_base, df_nuevo, list(claves))
+        return resultado, memoria_dataset(resultado[0])
+
+    clave = ('anexado', clave_base, clave_nuevos, claves)
+    return obtener_registro_datasets().obtener_o_cargar(clave, id_sesion(), anexar, descripcion)
 
 
 def aplicar_estilo_css(tema):
@@ -628,167 +1389,33 @@ def aplicar_estilo_css(tema):
     
     st.markdown(css, unsafe_allow_html=True)
 
-def crear_grafico_lineas(df, tema, categorias_seleccionadas):
-    """Crea un gráfico de líneas con colores elegantes en escala de grises"""
-    # Filtrar por categorías seleccionadas
-    df_filtrado = df[df['Categoria'].isin(categorias_seleccionadas)]
-    
-    # Agrupar por fecha
-    df_agrupado = df_filtrado.groupby('Fecha').agg({
-        'Ingresos': 'sum',
-        'Egresos': 'sum'
-    }).reset_index()
-    
-    fig = go.Figure()
-    
-    # Colores elegantes según el tema
-    if tema == "Oscuro":
-        color_ingresos = "#ffffff"  # Blanco puro para ingresos
-        color_egresos = "#808080"   # Gris medio para egresos
-        bg_color = "#0a0a0a"
-        text_color = "#e0e0e0"
-        grid_color = "#2a2a2a"
-    else:
-        color_ingresos = "#1a1a1a"  # Negro para ingresos
-        color_egresos = "#666666"   # Gris oscuro para egresos
-        bg_color = "#fafafa"
-        text_color = "#2a2a2a"
-        grid_color = "#e0e0e0"
-    
-    # Línea sólida para Ingresos con gradiente
-    fig.add_trace(go.Scatter(
-        x=df_agrupado["Fecha"],
-        y=df_agrupado["Ingresos"],
-        mode='lines+markers',
-        name='Ingresos',
-        line=dict(color=color_ingresos, width=4),
-        marker=dict(size=10, color=color_ingresos, line=dict(width=2, color=bg_color)),
-        fill='tonexty' if tema == "Oscuro" else None,
-        fillcolor='rgba(255, 255, 255, 0.1)' if tema == "Oscuro" else 'rgba(26, 26, 26, 0.1)'
-    ))
-    
-    # Línea para Egresos
-    fig.add_trace(go.Scatter(
-        x=df_agrupado["Fecha"],
-        y=df_agrupado["Egresos"],
-        mode='lines+markers',
-        name='Egresos',
-        line=dict(color=color_egresos, width=4, dash='dot'),
-        marker=dict(size=10, color=color_egresos, line=dict(width=2, color=bg_color))
-    ))
-    
-    fig.update_layout(
-        title=dict(
-            text="Ingresos y Egresos por Período",
-            font=dict(color=text_color, size=20, family="Arial Black")
-        ),
-        paper_bgcolor=bg_color,
-        plot_bgcolor=bg_color,
-        font=dict(color=text_color, family="Arial"),
-        height=450,
-        xaxis=dict(
-            gridcolor=grid_color, 
-            title="Fecha", 
-            tickcolor=text_color, 
-            linecolor=text_color,
-            title_font_color=text_color,
-            tickfont_color=text_color
-        ),
-        yaxis=dict(
-            gridcolor=grid_color, 
-            title="Monto", 
-            tickcolor=text_color, 
-            linecolor=text_color,
-            title_font_color=text_color,
-            tickfont_color=text_color
-        ),
-        legend=dict(
-            bgcolor='rgba(0,0,0,0)',
-            bordercolor=grid_color,
-            borderwidth=1,
-            font=dict(color=text_color)
-        )
-    )
-    
-    return fig
-
-def crear_grafico_barras_categorias(df, tema, categorias_seleccionadas):
-    """Crea un gráfico de barras por categorías con degradados elegantes"""
-    # Filtrar y agrupar por categoría
-    df_filtrado = df[df['Categoria'].isin(categorias_seleccionadas)]
-    df_agrupado = df_filtrado.groupby('Categoria').agg({
-        'Utilidad': 'sum'
-    }).reset_index()
-    
-    if tema == "Oscuro":
-        # Degradados de gris claro a blanco para positivos, gris medio a oscuro para negativos
-        color_positivo = "#e0e0e0"
-        color_negativo = "#606060"
-        bg_color = "#0a0a0a"
-        text_color = "#e0e0e0"
-        grid_color = "#2a2a2a"
-    else:
-        # Negro a gris oscuro para positivos, gris medio para negativos
-        color_positivo = "#2a2a2a"
-        color_negativo = "#888888"
-        bg_color = "#fafafa"
-        text_color = "#2a2a2a"
-        grid_color = "#e0e0e0"
-    
-    colors = [color_positivo if x >= 0 else color_negativo for x in df_agrupado["Utilidad"]]
-    
-    fig = go.Figure(data=[
-        go.Bar(
-            x=df_agrupado["Categoria"],
-            y=df_agrupado["Utilidad"],
-            marker=dict(
-                color=colors,
-                line=dict(width=2, color=bg_color),
-                opacity=0.9
-            ),
-            name="Utilidad por Categoría"
-        )
-    ])
-    
-    fig.update_layout(
-        title=dict(
-            text="Utilidad por Categoría",
-            font=dict(color=text_color, size=20, family="Arial Black")
-        ),
-        paper_bgcolor=bg_color,
-        plot_bgcolor=bg_color,
-        font=dict(color=text_color, family="Arial"),
-        height=450,
-        xaxis=dict(
-            title="Categoría",
-            title_font=dict(size=14, color=text_color),
-            tickfont=dict(color=text_color)
-        ),
-        yaxis=dict(
-            title="Utilidad",
-            title_font=dict(size=14, color=text_color),
-            gridcolor=grid_color,
-            showgrid=True,
-            gridwidth=1,
-            tickfont=dict(color=text_color)
-        ),
-        showlegend=False
-    )
-    
-    return fig
-
 # --------------------
 # SIDEBAR - WIDGETS COMPLETOS
 # --------------------
 st.sidebar.title("⚙️ Configuración y Filtros")
 
+# Datasets compartidos: la sesión retiene los que use en este rerun y suelta el resto al confirmar
+registro_datasets = obtener_registro_datasets()
+registro_datasets.iniciar_rerun(id_sesion())
+
+# Perfilado opcional del rerun: sus widgets están al final del sidebar, junto al desglose de tiempos
+RUTA_LOG_PERFILADO = os.environ.get('DASHBOARD_LOG_PERFILADO', 'perfilado_dashboard.jsonl')
+perfilador = Perfilador(
+    activo=st.session_state.get('perfilado_activo', False),
+    medir_memoria=st.session_state.get('perfilado_memoria', False),
+    ruta_log=RUTA_LOG_PERFILADO if st.session_state.get('perfilado_log', False) else None,
+    sesion=id_sesion(),
+    sesion_activa=sesion_activa
+)
+
 # 1. WIDGET: Radio Button para tema
 tema = st.sidebar.radio(
     "🎨 Tema visual", 
     ["Claro", "Oscuro"],
     help="Selecciona el tema de la interfaz"
 )
-aplicar_estilo_css(tema)
+with perfilador.etapa('estilos_css'):
+    aplicar_estilo_css(tema)
 
 st.sidebar.markdown("---")
 
@@ -799,6 +1426,18 @@ usar_datos_simulados = st.sidebar.checkbox(
     help="Desactiva para subir tu propio archivo"
 )
 
+# WIDGET: Radio para el origen de los datos propios
+ORIGEN_ARCHIVO = "Subir archivo"
+ORIGEN_DIRECTORIO = "Directorio Parquet/Feather"
+if usar_datos_simulados:
+    origen_datos = None
+else:
+    origen_datos = st.sidebar.radio(
+        "📂 Origen de los datos",
+        [ORIGEN_ARCHIVO, ORIGEN_DIRECTORIO],
+        help="Sube un archivo o lee un directorio de particiones columnares"
+    )
+
 # 3. WIDGETS para datos simulados
 if usar_datos_simulados:
     st.sidebar.subheader("🎲 Configuración de datos simulados")
@@ -819,63 +1458,81 @@ if usar_datos_simulados:
         index=2,
         help="Año base para generar los datos"
     )
+    
+    # WIDGETS: Parámetros avanzados de la simulación (pruebas de carga)
+    with st.sidebar.expander("⚙️ Parámetros de simulación"):
+        granularidad_simulada = st.selectbox(
+            "Granularidad de fechas",
+            options=list(FRECUENCIAS_SIMULACION),
+            help="Frecuencia de las fechas generadas"
+        )
+        filas_por_periodo = st.number_input(
+            "Registros por período",
+            min_value=1,
+            max_value=1_000_000,
+            value=4,
+            help="Cantidad de registros generados en cada período"
+        )
+        num_categorias = st.slider("Número de categorías", min_value=1, max_value=20, value=4)
+        num_departamentos = st.slider("Número de departamentos", min_value=1, max_value=20, value=5)
+        num_regiones = st.slider("Número de regiones", min_value=1, max_value=10, value=4)
+        semilla = st.number_input(
+            "Semilla",
+            min_value=0,
+            value=42,
+            help="La misma semilla reproduce los mismos datos"
+        )
+
+    # Acotar el total de filas para no agotar la memoria del proceso compartido
+    periodos_simulados = len(fechas_simuladas(num_meses, año_seleccionado, FRECUENCIAS_SIMULACION[granularidad_simulada]))
+    if periodos_simulados * filas_por_periodo > MAX_FILAS_SIMULADAS:
+        filas_por_periodo = max(1, MAX_FILAS_SIMULADAS // periodos_simulados)
+        st.sidebar.warning(
+            f"⚠️ Se admiten hasta {MAX_FILAS_SIMULADAS:,} registros simulados: "
+            f"se generan {filas_por_periodo:,} por período ({periodos_simulados:,} períodos)"
+        )
+
+st.sidebar.markdown("---")
+
+# WIDGET: Selectbox para el motor de consultas (DuckDB solo si está instalado)
+motor_consultas = st.sidebar.selectbox(
+    "🧮 Motor de consultas",
+    [MOTOR_PANDAS, MOTOR_DUCKDB] if duckdb is not None else [MOTOR_PANDAS],
+    help="DuckDB ejecuta filtros y agregaciones como SQL en todos los núcleos (requiere el paquete duckdb)"
+)
 
 st.sidebar.markdown("---")
 
 # 4. WIDGETS de filtros (siempre visibles)
 st.sidebar.subheader("🔍 Filtros de análisis")
 
-# Generar o cargar datos primero para obtener las opciones
-if usar_datos_simulados:
-    df_principal = generar_datos_falsos(num_meses, año_seleccionado)
-else:
-    df_principal = pd.DataFrame()  # Se llenará con upload
+# Contenedor de los filtros: se completa cuando los datos (simulados o subidos) están disponibles
+contenedor_filtros = st.sidebar.container()
 
-# WIDGET: Multiselect para categorías (solo si hay datos)
-if not df_principal.empty:
-    categorias_disponibles = df_principal['Categoria'].unique()
-    categorias_seleccionadas = st.sidebar.multiselect(
-        "Categorías a mostrar",
-        options=categorias_disponibles,
-        default=categorias_disponibles,
-        help="Selecciona las categorías a incluir en los análisis"
-    )
-    
-    # WIDGET: Date input para rango de fechas
-    fecha_min = df_principal['Fecha'].min().date()
-    fecha_max = df_principal['Fecha'].max().date()
-    
-    rango_fechas = st.sidebar.date_input(
-        "Rango de fechas",
-        value=(fecha_min, fecha_max),
-        min_value=fecha_min,
-        max_value=fecha_max,
-        help="Selecciona el período a analizar"
-    )
-    
-    # WIDGET: Number input para monto mínimo
-    monto_minimo = st.sidebar.number_input(
-        "Monto mínimo a mostrar",
-        min_value=0,
-        max_value=50000,
-        value=0,
-        step=500,
-        help="Filtrar registros por monto mínimo"
-    )
-    
-    # WIDGET: Select slider para regiones
-    regiones_disponibles = df_principal['Region'].unique()
-    regiones_seleccionadas = st.sidebar.select_slider(
-        "Regiones",
-        options=regiones_disponibles,
-        value=regiones_disponibles[0],
-        help="Desliza para seleccionar región"
+# Generar datos simulados (los archivos subidos se procesan en la sección de upload)
+if usar_datos_simulados:
+    parametros_simulacion = dict(
+        meses=num_meses,
+        año=año_seleccionado,
+        filas_por_periodo=filas_por_periodo,
+        num_categorias=num_categorias,
+        num_departamentos=num_departamentos,
+        num_regiones=num_regiones,
+        frecuencia=FRECUENCIAS_SIMULACION[granularidad_simulada],
+        semilla=semilla
     )
+    with perfilador.etapa('datos_simulados'):
+        df_principal = generar_datos_falsos(**parametros_simulacion)
+    clave_dataset = ('simulados', tuple(sorted(parametros_simulacion.items())))
 else:
-    categorias_seleccionadas = []
-    rango_fechas = None
-    monto_minimo = 0
-    regiones_seleccionadas = None
+    df_principal = pd.DataFrame()  # Se llenará con upload o con el directorio columnar
+    clave_dataset = None
+
+# Catálogo del directorio columnar: sus datos se leen después de elegir los filtros
+catalogo_columnar = None
+
+# Dataset base y filas conservadas cuando se anexan nuevos periodos a un dataset ya cargado
+anexo_dataset = None
 
 # --------------------
 # MAIN - UPLOAD DE ARCHIVOS
@@ -883,46 +1540,173 @@ else:
 st.title("📊 Dashboard Financiero V2")
 
 # SECCIÓN DE UPLOAD (solo si no se usan datos simulados)
-if not usar_datos_simulados:
+if origen_datos == ORIGEN_ARCHIVO:
     st.markdown("### 📁 Subir Archivo de Datos")
     
     col_upload1, col_upload2 = st.columns([2, 1])
     
     with col_upload1:
-        # WIDGET: File uploader con múltiples tipos
-        uploaded_file = st.file_uploader(
-            "Sube tu archivo de datos financieros",
+        # WIDGET: File uploader con múltiples archivos (p. ej. uno por mes y sucursal)
+        uploaded_files = st.file_uploader(
+            "Sube tus archivos de datos financieros",
             type=['csv', 'xlsx', 'xls'],
-            help="Formatos soportados: CSV, Excel (.xlsx, .xls)",
-            accept_multiple_files=False
+            help="Formatos soportados: CSV, Excel (.xlsx, .xls). Varios archivos se unen en un solo dataset",
+            accept_multiple_files=True
         )
         
-        if uploaded_file is not None:
+        # WIDGET: Checkbox para lectura por bloques de archivos grandes
+        carga_por_bloques = st.checkbox(
+            "⚡ Carga por bloques (archivos CSV grandes)",
+            help="Lee el CSV en bloques con tipos compactos (categóricas y 32 bits) para reducir la memoria"
+        )
+        
+        # WIDGETS: Columna y formato de fecha (vacíos para detectarlos automáticamente)
+        with st.expander("🗓️ Opciones de fecha"):
+            columna_fecha = st.text_input(
+                "Columna de fecha",
+                placeholder="Detección automática",
+                help="Nombre de la columna que contiene las fechas; vacío para detectarla con una muestra de filas"
+            )
+            formato_fecha = st.text_input(
+                "Formato de fecha",
+                placeholder="%d/%m/%Y",
+                help="Formato strftime de las fechas; vacío para detectarlo con una muestra de filas"
+            )
+        opciones_fecha = {}
+        if columna_fecha.strip():
+            opciones_fecha['columna_fecha'] = columna_fecha.strip()
+        if formato_fecha.strip():
+            opciones_fecha['formato_fecha'] = formato_fecha.strip()
+        opciones_lectura = dict(opciones_fecha)
+        if carga_por_bloques:
+            opciones_lectura['por_bloques'] = True
+        
+        df_cargado = None
+        if len(uploaded_files) == 1:
+            uploaded_file = uploaded_files[0]
+            
             # Mostrar información del archivo
             st.success(f"✅ Archivo cargado: {uploaded_file.name}")
             st.info(f"📏 Tamaño: {uploaded_file.size} bytes")
             
-            # Procesar el archivo
-            if uploaded_file.name.endswith('.csv'):
-                df_cargado, error = procesar_archivo_csv(uploaded_file)
-            else:
-                try:
-                    df_cargado = pd.read_excel(uploaded_file)
-                    error = None
-                except Exception as e:
-                    df_cargado = None
-                    error = str(e)
+            # Procesar el archivo (o reutilizarlo si ya se procesó el mismo contenido)
+            barra_progreso = st.empty()
+            
+            def reportar_progreso(filas, fraccion):
+                barra_progreso.progress(fraccion or 0.0, text=f"📥 {filas:,} registros cargados")
+            
+            if not uploaded_file.name.endswith('.csv'):
+                # WIDGETS: Hojas y rango de columnas para Excel
+                hojas_disponibles = obtener_hojas_excel(calcular_hash_archivo(uploaded_file), uploaded_file)
+                hojas_seleccionadas = st.multiselect(
+                    "Hojas a cargar",
+                    options=hojas_disponibles,
+                    default=hojas_disponibles[:1],
+                    help="Las hojas seleccionadas se unen en un solo dataset"
+                )
+                rango_columnas = st.text_input(
+                    "Rango de columnas",
+                    placeholder="A:F",
+                    help="Columnas de Excel a leer; vacío para leer todas"
+                )
+                opciones_lectura = {
+                    'hojas': tuple(hojas_seleccionadas), 'columnas': rango_columnas.strip() or None, **opciones_fecha
+                }
+            with perfilador.etapa('carga_archivo'):
+                df_cargado, error = cargar_archivo(uploaded_file, progreso=reportar_progreso, **opciones_lectura)
+            barra_progreso.empty()
             
             if error:
                 st.error(f"❌ Error al procesar archivo: {error}")
-                df_principal = pd.DataFrame()
             else:
-                df_principal = df_cargado
-                st.success(f"✅ Datos cargados correctamente: {len(df_principal)} registros")
-                
-                # Mostrar vista previa
-                with st.expander("👀 Vista previa de los datos"):
-                    st.dataframe(df_principal.head())
+                clave_dataset = ('archivo',) + clave_archivo(uploaded_file, opciones_lectura)
+        
+        elif len(uploaded_files) > 1:
+            tamaño_total = sum(archivo.size for archivo in uploaded_files)
+            st.success(f"✅ {len(uploaded_files)} archivos cargados")
+            st.info(f"📏 Tamaño total: {tamaño_total} bytes")
+            
+            # Procesar los archivos en paralelo (o reutilizar el resultado si ya se procesaron)
+            barra_progreso = st.empty()
+            
+            def reportar_progreso_archivo(nombre, error, completados, total):
+                estado = "❌" if error else "✅"
+                barra_progreso.progress(completados / total, text=f"{estado} {nombre} ({completados}/{total})")
+            
+            with perfilador.etapa('carga_archivos'):
+                df_cargado, errores_archivos, avisos_esquema = cargar_archivos(
+                    uploaded_files, opciones_lectura, progreso=reportar_progreso_archivo
+                )
+            barra_progreso.empty()
+            
+            for nombre, error in errores_archivos.items():
+                st.error(f"❌ Error al procesar {nombre}: {error}")
+            for aviso in avisos_esquema:
+                st.warning(f"⚠️ {aviso}")
+            if df_cargado is not None:
+                clave_dataset = ('archivos',) + clave_archivos(uploaded_files, opciones_lectura)
+                archivos_correctos = len(uploaded_files) - len(errores_archivos)
+                st.info(f"📚 {archivos_correctos} de {len(uploaded_files)} archivos unidos en un solo dataset")
+        
+        if df_cargado is not None:
+            # WIDGETS: Anexar nuevos periodos al dataset cargado sin reprocesar el historial
+            with st.expander("➕ Anexar nuevos periodos"):
+                archivos_nuevos = st.file_uploader(
+                    "Archivos con los nuevos periodos",
+                    type=['csv', 'xlsx', 'xls'],
+                    help="Se agregan al dataset cargado; solo se recalculan los meses que cambian",
+                    accept_multiple_files=True,
+                    key='archivos_anexar'
+                )
+                claves_duplicados = st.multiselect(
+                    "Columnas clave para eliminar duplicados",
+                    options=list(df_cargado.columns),
+                    default=[],
+                    help="Las filas nuevas reemplazan a las existentes con la misma clave; vacío para no deduplicar. "
+                         "Elige columnas que identifiquen cada registro (p. ej. un número de transacción)"
+                )
+            
+            if archivos_nuevos:
+                opciones_anexo = {clave: valor for clave, valor in opciones_lectura.items() if clave not in ('hojas', 'columnas')}
+                with perfilador.etapa('carga_anexo'):
+                    df_nuevo, errores_anexo, avisos_anexo = cargar_archivos(archivos_nuevos, opciones_anexo)
+                for nombre, error in errores_anexo.items():
+                    st.error(f"❌ Error al procesar {nombre}: {error}")
+                if df_nuevo is not None:
+                    clave_nuevos = clave_archivos(archivos_nuevos, opciones_anexo)
+                    with perfilador.etapa('anexar_periodos'):
+                        df_anexado, conservadas, periodos_anexo, avisos = anexar_dataset(
+                            clave_dataset, clave_nuevos, tuple(claves_duplicados), df_cargado, df_nuevo,
+                            descripcion="Anexo: " + ", ".join(archivo.name for archivo in archivos_nuevos)
+                        )
+                    for aviso in avisos_anexo + avisos:
+                        st.warning(f"⚠️ {aviso}")
+                    anexo_dataset = (clave_dataset, df_cargado, conservadas, periodos_anexo)
+                    clave_dataset = ('anexado', clave_dataset, clave_nuevos, tuple(claves_duplicados))
+                    df_cargado = df_anexado
+                    st.info(
+                        f"➕ {len(df_nuevo):,} registros anexados · {len(periodos_anexo)} meses actualizados"
+                    )
+            
+            df_principal = df_cargado
+            st.success(f"✅ Datos cargados correctamente: {len(df_principal)} registros")
+            memoria = df_principal.attrs.get('memoria')
+            if memoria and memoria['antes']:
+                st.caption(
+                    f"🗜️ Memoria del dataset: {memoria['antes'] / 1024 ** 2:,.1f} MB al leerlo → "
+                    f"{memoria['despues'] / 1024 ** 2:,.1f} MB compactado "
+                    f"({1 - memoria['despues'] / memoria['antes']:.0%} menos)"
+                )
+            estado_registro = registro_datasets.estadisticas()
+            st.caption(
+                f"🗃️ Datasets compartidos: {estado_registro['aciertos']} aciertos · "
+                f"{estado_registro['fallos']} fallos · {estado_registro['entradas']} en memoria "
+                f"({estado_registro['bytes'] / 1024 ** 2:,.1f} MB)"
+            )
+            
+            # Mostrar vista previa
+            with st.expander("👀 Vista previa de los datos"):
+                st.dataframe(df_principal.head())
     
     with col_upload2:
         # Ejemplo de formato esperado
@@ -945,71 +1729,270 @@ if not usar_datos_simulados:
             help="Descarga una plantilla para estructurar tus datos"
         )
 
+# SECCIÓN DE DIRECTORIO COLUMNAR
+if origen_datos == ORIGEN_DIRECTORIO:
+    st.markdown("### 🗄️ Directorio de Datos Columnar")
+    
+    # WIDGET: Text input para la ruta del directorio
+    directorio_datos = st.text_input(
+        "Directorio con particiones Parquet/Feather",
+        value=os.environ.get('DASHBOARD_DIRECTORIO_DATOS', 'datos_financieros'),
+        help="Particiones por año y mes, p. ej. año=2024/mes=1/datos.parquet"
+    )
+    firma_datos = firma_directorio(directorio_datos)
+    if firma_datos:
+        catalogo_columnar = leer_catalogo_columnar(directorio_datos, firma_datos)
+        st.success(f"✅ {len(firma_datos)} archivos encontrados en {directorio_datos}")
+    else:
+        st.error(f"❌ No se encontraron archivos .parquet/.feather en '{directorio_datos}'")
+
+# Se confirma antes de un posible st.stop(); las estructuras derivadas se confirman al construirlas
+registro_datasets.confirmar_rerun(id_sesion())
+
 # Solo continuar si hay datos disponibles
-if df_principal.empty:
+if df_principal.empty and catalogo_columnar is None:
     st.warning("⚠️ No hay datos disponibles. Activa 'Usar datos simulados' o sube un archivo.")
     st.stop()
 
-# Aplicar filtros a los datos
-df_filtrado = df_principal.copy()
+# --------------------
+# FILTROS DE ANÁLISIS
+# --------------------
+opciones = catalogo_columnar if catalogo_columnar is not None else opciones_filtros(df_principal)
+
+# WIDGET: Multiselect para categorías
+if 'categorias' in opciones:
+    categorias_disponibles = opciones['categorias']
+    categorias_seleccionadas = contenedor_filtros.multiselect(
+        "Categorías a mostrar",
+        options=categorias_disponibles,
+        default=categorias_disponibles,
+        help="Selecciona las categorías a incluir en los análisis"
+    )
+else:
+    categorias_seleccionadas = None
+
+# WIDGET: Date input para rango de fechas
+if 'fecha_min' in opciones:
+    fecha_min = opciones['fecha_min']
+    fecha_max = opciones['fecha_max']
+    
+    rango_fechas = contenedor_filtros.date_input(
+        "Rango de fechas",
+        value=(fecha_min, fecha_max),
+        min_value=fecha_min,
+        max_value=fecha_max,
+        help="Selecciona el período a analizar"
+    )
+else:
+    rango_fechas = None
+
+# WIDGET: Number input para monto mínimo
+monto_minimo = contenedor_filtros.number_input(
+    "Monto mínimo a mostrar",
+    min_value=0,
+    max_value=50000,
+    value=0,
+    step=500,
+    help="Filtrar registros por monto mínimo"
+)
+
+# WIDGET: Multiselect para regiones
+if 'regiones' in opciones:
+    regiones_disponibles = opciones['regiones']
+    regiones_seleccionadas = contenedor_filtros.multiselect(
+        "Regiones",
+        options=regiones_disponibles,
+        default=regiones_disponibles,
+        help="Selecciona las regiones a incluir en los análisis"
+    )
+else:
+    regiones_seleccionadas = None
+
+# WIDGET: Multiselect para departamentos
+if 'departamentos' in opciones:
+    departamentos_disponibles = opciones['departamentos']
+    departamentos_seleccionados = contenedor_filtros.multiselect(
+        "Departamentos",
+        options=departamentos_disponibles,
+        default=departamentos_disponibles,
+        help="Selecciona los departamentos a incluir en los análisis"
+    )
+else:
+    departamentos_seleccionados = None
+
+def seleccion_dimension(seleccion, disponibles):
+    """Selección de un filtro de dimensión, o None si incluye todas las opciones (no filtra)"""
+    if seleccion is None or len(seleccion) == len(disponibles):
+        return None
+    return list(seleccion)
 
-# Filtrar por rango de fechas si está disponible
-if rango_fechas and len(rango_fechas) == 2:
-    fecha_inicio, fecha_fin = rango_fechas
-    df_filtrado = df_filtrado[
-        (df_filtrado['Fecha'].dt.date >= fecha_inicio) & 
-        (df_filtrado['Fecha'].dt.date <= fecha_fin)
-    ]
+filtros_sidebar = dict(
+    rango_fechas=rango_fechas if rango_fechas and len(rango_fechas) == 2 else None,
+    monto_minimo=monto_minimo,
+    categorias=seleccion_dimension(categorias_seleccionadas, opciones.get('categorias', [])),
+    regiones=seleccion_dimension(regiones_seleccionadas, opciones.get('regiones', [])),
+    departamentos=seleccion_dimension(departamentos_seleccionados, opciones.get('departamentos', []))
+)
 
-# Filtrar por monto mínimo
-if 'Ingresos' in df_filtrado.columns:
-    df_filtrado = df_filtrado[df_filtrado['Ingresos'] >= monto_minimo]
+def combinar_filtros_cruzados(filtros, rango_cruzado=None, categorias_cruzadas=None):
+    """Filtros del sidebar restringidos por las selecciones hechas en los gráficos"""
+    combinados = dict(filtros)
+    if rango_cruzado is not None:
+        inicio, fin = rango_cruzado[0].date(), rango_cruzado[1].date()
+        if filtros['rango_fechas'] is not None:
+            inicio, fin = max(inicio, filtros['rango_fechas'][0]), min(fin, filtros['rango_fechas'][1])
+        combinados['rango_fechas'] = (inicio, fin)
+    if categorias_cruzadas is not None:
+        combinados['categorias'] = [
+            categoria for categoria in categorias_cruzadas
+            if filtros['categorias'] is None or categoria in filtros['categorias']
+        ]
+    return combinados
 
-# Filtrar por región si está disponible
-if regiones_seleccionadas and 'Region' in df_filtrado.columns:
-    df_filtrado = df_filtrado[df_filtrado['Region'] == regiones_seleccionadas]
+# Filtros cruzados: el tramo seleccionado en el gráfico de tendencia filtra las fechas y las barras
+# elegidas filtran las categorías del resto del dashboard. El gráfico de barras no se filtra por su
+# propia selección (la resalta) para que se puedan elegir otras categorías.
+rango_cruzado = st.session_state.get('zoom_lineas')
+categorias_cruzadas = st.session_state.get('seleccion_categorias')
+filtros = combinar_filtros_cruzados(filtros_sidebar, rango_cruzado, categorias_cruzadas)
+filtros_barras = combinar_filtros_cruzados(filtros_sidebar, rango_cruzado)
+
+if motor_consultas == MOTOR_DUCKDB:
+    # DuckDB: los filtros y las agregaciones se resuelven en SQL. Un directorio columnar se
+    # consulta directamente sin cargarlo en pandas, y nunca se materializan las filas filtradas:
+    # la tabla pide solo su página y la exportación se escribe desde SQL.
+    with perfilador.etapa('filtrado'):
+        if catalogo_columnar is not None:
+            clave_dataset = ('columnar', directorio_datos, firma_datos)
+            motor = obtener_motor_duckdb(clave_dataset, abrir_dataset_columnar(directorio_datos, firma_datos))
+        else:
+            motor = obtener_motor_duckdb(clave_dataset, df_principal)
+    df_filtrado = df_base = posiciones_filtradas = df_barras = None
+    
+    def serie_por_nivel(nivel):
+        """Serie del gráfico de tendencia agregada en SQL al `nivel` temporal"""
+        return motor.serie_temporal(nivel=nivel, **filtros)
+    rollups_temporales = None
+    
+    with perfilador.etapa('agregacion'):
+        totales = motor.totales(**filtros)
+        utilidad_agrupada = motor.utilidad_por_categoria(**filtros_barras)
+        resumen_agrupado = motor.resumen_categoria(**filtros)
+else:
+    # Directorio columnar: leer solo las particiones y categorías que piden los filtros
+    if catalogo_columnar is not None:
+        with perfilador.etapa('lectura_columnar'):
+            df_principal = leer_dataset_columnar(
+                directorio_datos, firma_datos, filtros_sidebar['rango_fechas'], categorias_seleccionadas
+            )
+        clave_dataset = ('columnar', directorio_datos, firma_datos, filtros_sidebar['rango_fechas'],
+                         tuple(categorias_seleccionadas or ()))
+        if df_principal.empty:
+            st.warning("⚠️ No hay registros en el directorio para los filtros seleccionados.")
+            st.stop()
+    
+    # Aplicar filtros mediante los índices precalculados del dataset (sin copiar el DataFrame base)
+    motor = None
+    with perfilador.etapa('filtrado'):
+        indice_filtros = obtener_indice_filtros(clave_dataset, df_principal, anexo_dataset)
+        posiciones_filtradas, df_filtrado = filtrar_dataset(df_principal, indice_filtros, filtros)
+        df_base = df_principal
+    
+    # Agregados desde el cubo mensual si los filtros abarcan celdas completas (o desde las celdas
+    # diarias de los rollups si el rango corta meses, como un tramo del gráfico); si no, se
+    # agrupan las filas filtradas
+    with perfilador.etapa('agregacion'):
+        cubo_mensual = obtener_cubo_mensual(clave_dataset, df_principal, anexo_dataset)
+        rollups_temporales = obtener_rollups_temporales(clave_dataset, df_principal, anexo_dataset)
+        cubo_diario = rollups_temporales.cubo_diario if rollups_temporales is not None else None
+        totales, _, utilidad_agrupada, resumen_agrupado = agregar_filtrados(
+            cubo_mensual, filtros, df_filtrado, cubo_diario
+        )
+        
+        # Las barras solo ignoran la selección de categorías hecha sobre ellas mismas
+        df_barras = df_filtrado
+        if categorias_cruzadas is not None:
+            cubo_barras, celdas_barras = seleccionar_celdas([cubo_mensual, cubo_diario], filtros_barras)
+            if celdas_barras is not None:
+                utilidad_agrupada, df_barras = cubo_barras.utilidad_por_categoria(celdas_barras), None
+            else:
+                utilidad_agrupada = None
+                df_barras = filtrar_dataset(df_principal, indice_filtros, filtros_barras)[1]
+    
+    def serie_por_nivel(nivel):
+        """Serie del gráfico de tendencia desde los rollups, o agrupando las filas filtradas si no alcanzan"""
+        serie = rollups_temporales.serie(nivel, **filtros) if rollups_temporales is not None else None
+        return serie if serie is not None else agrupar_por_nivel(df_filtrado, nivel)
+
+# La sesión retiene el índice, los cubos, los rollups y el motor que usó en este rerun
+registro_datasets.confirmar_rerun(id_sesion())
+
+def serie_memorizada(nivel):
+    """Serie por periodo del `nivel` para los filtros actuales, agregada una vez por sesión"""
+    return memorizar_serie((clave_dataset, congelar_filtros(filtros), nivel), lambda: serie_por_nivel(nivel))
+
+# Días con datos para elegir el nivel temporal del gráfico (None si no hay fechas)
+if rollups_temporales is not None:
+    dias_con_datos = rollups_temporales.dias
+elif motor is not None:
+    dias_con_datos = motor.dias_con_datos()
+elif 'Fecha' in df_filtrado.columns and pd.api.types.is_datetime64_any_dtype(df_filtrado['Fecha']):
+    dias_con_datos = df_filtrado['Fecha'].dt.floor('D').dropna().unique()
+else:
+    dias_con_datos = None
 
 # --------------------
 # MÉTRICAS PRINCIPALES
 # --------------------
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    total_ingresos = df_filtrado['Ingresos'].sum() if 'Ingresos' in df_filtrado.columns else 0
-    st.markdown(f"""
-    <div class="metric-container">
-        <div class="metric-title">💰 Ingresos totales</div>
-        <div class="metric-value">${total_ingresos:,.0f}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-with col2:
-    total_egresos = df_filtrado['Egresos'].sum() if 'Egresos' in df_filtrado.columns else 0
-    st.markdown(f"""
-    <div class="metric-container">
-        <div class="metric-title">💸 Egresos totales</div>
-        <div class="metric-value">${total_egresos:,.0f}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-with col3:
-    utilidad_total = total_ingresos - total_egresos
-    emoji_utilidad = "📈" if utilidad_total >= 0 else "📉"
-    st.markdown(f"""
-    <div class="metric-container">
-        <div class="metric-title">{emoji_utilidad} Utilidad neta</div>
-        <div class="metric-value">${utilidad_total:,.0f}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-with col4:
-    num_registros = len(df_filtrado)
-    st.markdown(f"""
-    <div class="metric-container">
-        <div class="metric-title">📊 Registros</div>
-        <div class="metric-value">{num_registros:,}</div>
-    </div>
-    """, unsafe_allow_html=True)
+with perfilador.etapa('metricas'):
+    col1, col2, col3, col4 = st.columns(4)
+    
+    # Acumulado del año y variación interanual desde la serie diaria (no desde las filas)
+    acumulados = indicadores_acumulados(serie_memorizada('Día')) if dias_con_datos is not None else None
+
+    with col1:
+        total_ingresos = totales.get('Ingresos', 0)
+        detalle_ingresos = ""
+        if acumulados is not None:
+            variacion = f" · {acumulados['interanual']:+.1f}% interanual" if acumulados['interanual'] is not None else ""
+            detalle_ingresos = (
+                f'<div class="metric-delta">YTD {acumulados["año"]}: ${acumulados["ingresos"]:,.0f}{variacion}</div>'
+            )
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-title">💰 Ingresos totales</div>
+            <div class="metric-value">${total_ingresos:,.0f}</div>{detalle_ingresos}
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col2:
+        total_egresos = totales.get('Egresos', 0)
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-title">💸 Egresos totales</div>
+            <div class="metric-value">${total_egresos:,.0f}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col3:
+        utilidad_total = total_ingresos - total_egresos
+        emoji_utilidad = "📈" if utilidad_total >= 0 else "📉"
+        detalle_utilidad = f'<div class="metric-delta">Margen {100 * utilidad_total / total_ingresos:.1f}%</div>' if total_ingresos else ""
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-title">{emoji_utilidad} Utilidad neta</div>
+            <div class="metric-value">${utilidad_total:,.0f}</div>{detalle_utilidad}
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col4:
+        num_registros = totales['Registros']
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-title">📊 Registros</div>
+            <div class="metric-value">{num_registros:,}</div>
+        </div>
+        """, unsafe_allow_html=True)
 
 st.markdown("---")
 
@@ -1017,11 +2000,172 @@ st.markdown("---")
 # GRÁFICOS
 # --------------------
     
-fig1 = crear_grafico_lineas(df_filtrado, tema, categorias_seleccionadas)
-st.plotly_chart(fig1, use_container_width=True)
+# Los gráficos, sus opciones y el zoom forman un fragmento: interactuar con ellos solo
+# vuelve a ejecutar esta sección. Con agregados disponibles (rollups, cubo o DuckDB) no se reagrupan las filas.
+@st.fragment
+def seccion_graficos(df_filtrado, serie_por_nivel, dias_con_datos, df_barras, utilidad_agrupada, tema,
+                     categorias_seleccionadas, rango_filtro, clave_graficos, cruce_aplicado):
+    """Gráfico de tendencia (por nivel temporal, con reducción de puntos y zoom) y gráfico de utilidad por categoría.
+
+    Las selecciones en los gráficos son filtros cruzados: si cambian respecto a `cruce_aplicado`
+    se vuelve a ejecutar toda la app para que métricas y tablas las apliquen.
+    """
+    cruce_actual = (st.session_state.get('zoom_lineas'), st.session_state.get('seleccion_categorias'))
+    if cruce_actual != cruce_aplicado:
+        st.rerun(scope="app")
+    
+    # WIDGETS: Agrupación temporal y reducción de puntos del gráfico de tendencia
+    with st.expander("📈 Opciones del gráfico de tendencia"):
+        agrupacion = st.selectbox(
+            "Agrupación temporal",
+            options=['Automática'] + list(NIVELES_TEMPORALES),
+            help="Automática usa el nivel más fino que no supera un punto cada 2 píxeles en el rango visible"
+        )
+        metodo_reduccion = st.selectbox(
+            "Reducción de puntos",
+            options=METODOS_REDUCCION,
+            help="LTTB conserva la forma de la serie; Mín/Máx conserva los picos de cada tramo"
+        )
+        ancho_grafico = st.slider(
+            "Ancho aproximado del gráfico (px)",
+            min_value=400,
+            max_value=3000,
+            value=1200,
+            step=100,
+            help="Se dibuja como máximo un punto cada 2 píxeles"
+        )
+        ventana_media = st.number_input(
+            "Media móvil (periodos)",
+            min_value=0,
+            max_value=52,
+            value=0,
+            help="Periodos del nivel temporal que promedia la media móvil; 0 para no mostrarla"
+        )
+        indicador = st.selectbox(
+            "Indicador en el eje secundario",
+            options=list(INDICADORES_TENDENCIA),
+            help="Margen, variación contra el mismo periodo del año anterior o acumulados del año (YTD)"
+        )
+
+    def actualizar_zoom_lineas():
+        """Guarda como zoom (y filtro cruzado) el rango seleccionado con caja en el gráfico de líneas.
+
+        El rango se ajusta a los periodos completos del nivel graficado, así el cubo diario
+        responde los agregados sin recorrer las filas.
+        """
+        cajas = st.session_state.grafico_lineas.selection.get('box', [])
+        if cajas:
+            limites = [
+                pd.to_datetime(valor, unit='ms') if isinstance(valor, (int, float)) else pd.to_datetime(valor)
+                for valor in cajas[0]['x']
+            ]
+            rango = (min(limites), max(limites))
+            if nivel is not None:
+                rango = ajustar_a_periodos(*rango, nivel)
+            if rango is not None:
+                st.session_state.zoom_lineas = rango
+
+    def actualizar_seleccion_categorias():
+        """Guarda como filtro cruzado las categorías elegidas con clic en el gráfico de barras"""
+        puntos = st.session_state.grafico_barras.selection.get('points', [])
+        if puntos:
+            st.session_state.seleccion_categorias = sorted({punto['x'] for punto in puntos})
+        else:
+            st.session_state.pop('seleccion_categorias', None)
+
+    rango_zoom = st.session_state.get('zoom_lineas')
+    
+    # Sin fechas se grafican los valores originales de Fecha
+    if dias_con_datos is None:
+        nivel = None
+    elif agrupacion == 'Automática':
+        nivel = nivel_temporal_automatico(dias_con_datos, ancho_grafico // 2, rango_zoom or rango_filtro)
+    else:
+        nivel = agrupacion
+
+    def construir_grafico_lineas():
+        # Sin nivel, DuckDB (que no tiene las filas filtradas) agrupa en SQL por los valores de Fecha
+        if nivel is not None:
+            df_agrupado = analizar_serie(serie_por_nivel(nivel), nivel, ventana_media)
+        else:
+            df_agrupado = serie_por_nivel(None) if df_filtrado is None else None
+        figura = crear_grafico_lineas(
+            df_filtrado,
+            tema,
+            categorias_seleccionadas,
+            df_agrupado=df_agrupado,
+            puntos_maximos=ancho_grafico // 2,
+            metodo_reduccion=metodo_reduccion,
+            rango_visible=rango_zoom,
+            indicador=indicador
+        )
+        figura.update_layout(dragmode='select')
+        return figura
 
-fig2 = crear_grafico_barras_categorias(df_filtrado, tema, categorias_seleccionadas)
-st.plotly_chart(fig2, use_container_width=True)
+    with perfilador.etapa('grafico_lineas'):
+        fig1 = memorizar_grafico(
+            ('lineas',) + clave_graficos + (nivel, ventana_media, indicador, ancho_grafico // 2, metodo_reduccion, rango_zoom),
+            construir_grafico_lineas
+        )
+        st.plotly_chart(
+            fig1,
+            use_container_width=True,
+            key="grafico_lineas",
+            on_select=actualizar_zoom_lineas,
+            selection_mode="box"
+        )
+    texto_nivel = f" · 📅 Agrupado por {nivel.lower()}" if nivel is not None else ""
+    if rango_zoom is not None:
+        col_zoom1, col_zoom2 = st.columns([4, 1])
+        col_zoom1.caption(
+            f"🔎 Detalle del {rango_zoom[0]:%Y/%m/%d} al {rango_zoom[1]:%Y/%m/%d}{texto_nivel}"
+        )
+        if col_zoom2.button("↩️ Restablecer zoom"):
+            del st.session_state.zoom_lineas
+            st.rerun(scope="app")
+    else:
+        st.caption(f"🔎 Selecciona un tramo con el cursor para ver más detalle{texto_nivel}")
+
+    seleccion_categorias = st.session_state.get('seleccion_categorias')
+    with perfilador.etapa('grafico_barras'):
+        fig2 = memorizar_grafico(
+            ('barras',) + clave_graficos + (tuple(seleccion_categorias or ()),),
+            lambda: crear_grafico_barras_categorias(
+                df_barras, tema, categorias_seleccionadas, df_agrupado=utilidad_agrupada,
+                seleccionadas=seleccion_categorias
+            )
+        )
+        st.plotly_chart(
+            fig2,
+            use_container_width=True,
+            key="grafico_barras",
+            on_select=actualizar_seleccion_categorias,
+            selection_mode="points"
+        )
+
+    # Resumen de los filtros cruzados activos
+    if rango_zoom is not None or seleccion_categorias is not None:
+        partes = []
+        if rango_zoom is not None:
+            partes.append(f"fechas del {rango_zoom[0]:%Y/%m/%d} al {rango_zoom[1]:%Y/%m/%d}")
+        if seleccion_categorias is not None:
+            partes.append(f"categorías {', '.join(map(str, seleccion_categorias))}")
+        col_cruce1, col_cruce2 = st.columns([4, 1])
+        col_cruce1.caption(f"🎯 Filtros cruzados: {' · '.join(partes)}")
+        if col_cruce2.button("✖️ Quitar filtros cruzados"):
+            st.session_state.pop('zoom_lineas', None)
+            st.session_state.pop('seleccion_categorias', None)
+            st.rerun(scope="app")
+    else:
+        st.caption("🎯 Haz clic en una barra (Shift para varias) para filtrar el resto del dashboard por categoría")
+
+# Las figuras se memorizan por dataset, tema y filtros (más las opciones propias de cada gráfico).
+# Las barras dependen además de los filtros sin su propia selección de categorías.
+seccion_graficos(
+    df_filtrado, serie_memorizada, dias_con_datos, df_barras, utilidad_agrupada, tema, categorias_seleccionadas,
+    filtros['rango_fechas'], (clave_dataset, tema, congelar_filtros(filtros), congelar_filtros(filtros_barras)),
+    (rango_cruzado, categorias_cruzadas)
+)
 
 # --------------------
 # TABLA DE DATOS Y WIDGETS ADICIONALES
@@ -1031,74 +2175,111 @@ st.markdown("### 📋 Análisis Detallado")
 # WIDGET: Tabs para diferentes vistas
 tab1, tab2, tab3 = st.tabs(["📊 Datos Completos", "📈 Resumen por Categoría", "🎛️ Widgets Demo"])
 
-with tab1:
+# La tabla y la pestaña de widgets son fragmentos: sus widgets solo vuelven a ejecutar su sección
+@st.fragment
+def seccion_tabla(df_base, posiciones_filtradas, clave_dataset, filtros, motor=None):
+    """Tabla paginada y ordenada en el servidor sobre las posiciones filtradas de df_base.
+
+    Con `motor` (DuckDB) no hay posiciones: el conteo, el orden y cada página se piden en SQL.
+    """
     # WIDGET: Checkbox para mostrar solo utilidades positivas
     solo_positivas = st.checkbox("Mostrar solo utilidades positivas")
     
-    df_tabla = df_filtrado.copy()
-    if solo_positivas and 'Utilidad' in df_tabla.columns:
-        df_tabla = df_tabla[df_tabla['Utilidad'] > 0]
+    # La tabla trabaja con posiciones sobre df_base: solo se materializa la página visible
+    if motor is not None:
+        columnas = motor.columnas
+        total_registros = motor.totales(solo_positivas=solo_positivas, **filtros)['Registros']
+    else:
+        columnas = list(df_base.columns)
+        posiciones_tabla = posiciones_filtradas
+        if solo_positivas and 'Utilidad' in df_base.columns:
+            utilidad = df_base['Utilidad'].to_numpy()
+            posiciones_tabla = posiciones_tabla[utilidad[posiciones_tabla] > 0]
+        total_registros = len(posiciones_tabla)
     
-    # Formatear DataFrame para mostrar
-    if not df_tabla.empty:
-        df_display = df_tabla.copy()
-        if 'Fecha' in df_display.columns:
-            df_display["Fecha"] = df_display["Fecha"].dt.strftime("%Y/%m/%d")
+    if total_registros > 0:
+        col_orden, col_direccion, col_tamaño, col_pagina = st.columns([2, 1, 1, 1])
         
-        # Aplicar formato a columnas numéricas
-        numeric_columns = df_display.select_dtypes(include=[np.number]).columns
-        format_dict = {col: "${:,.0f}" if col in ['Ingresos', 'Egresos', 'Utilidad'] else "{:,.0f}" 
-                      for col in numeric_columns}
+        # WIDGETS: Ordenamiento y paginación en el servidor
+        with col_orden:
+            columna_orden = st.selectbox("Ordenar por", ["(orden original)"] + columnas)
+        with col_direccion:
+            descendente = st.toggle("Descendente")
+        with col_tamaño:
+            tamaño_pagina = st.selectbox("Filas por página", TAMAÑOS_PAGINA, index=1)
         
-        if format_dict:
-            df_styled = df_display.style.format(format_dict)
-            st.dataframe(df_styled, use_container_width=True)
-        else:
-            st.dataframe(df_display, use_container_width=True)
+        total_paginas = -(-total_registros // tamaño_pagina)
+        # La página vive solo en session_state (sin `value`) para poder acotarla si cambia el total
+        st.session_state.setdefault('pagina_tabla', 1)
+        if st.session_state.pagina_tabla > total_paginas:
+            st.session_state.pagina_tabla = total_paginas
+        with col_pagina:
+            pagina = st.number_input("Página", min_value=1, max_value=total_paginas, key='pagina_tabla')
+        
+        inicio = (pagina - 1) * tamaño_pagina
+        if motor is not None:
+            df_pagina = motor.pagina(
+                inicio, tamaño_pagina, columna_orden if columna_orden != "(orden original)" else None,
+                descendente, solo_positivas=solo_positivas, **filtros
+            )
+        elif columna_orden != "(orden original)":
+            # El orden se cachea por estado de filtros para que cambiar de página no reordene
+            cache_orden = obtener_cache_sesion('cache_orden_tabla')
+            clave_orden = (clave_dataset, repr(sorted(filtros.items())), solo_positivas, columna_orden, descendente)
+            orden = cache_orden.obtener(clave_orden)
+            if orden is None:
+                valores = df_base[columna_orden].take(posiciones_tabla)
+                orden = posiciones_tabla[ordenar_posiciones(valores, descendente)]
+                cache_orden.guardar(clave_orden, orden)
+            posiciones_tabla = orden
+        if motor is None:
+            df_pagina = df_base.take(posiciones_tabla[inicio:inicio + tamaño_pagina])
+        st.dataframe(
+            df_pagina,
+            use_container_width=True,
+            column_config=configurar_columnas_tabla(df_pagina)
+        )
+        st.caption(
+            f"Mostrando registros {inicio + 1:,}–{inicio + len(df_pagina):,} de {total_registros:,} "
+            f"(página {pagina} de {total_paginas:,})"
+        )
     else:
         st.info("No hay datos que mostrar con los filtros actuales.")
 
-with tab2:
-    if not df_filtrado.empty and 'Categoria' in df_filtrado.columns:
-        resumen_categoria = df_filtrado.groupby('Categoria').agg({
-            'Ingresos': ['sum', 'mean', 'count'],
-            'Egresos': ['sum', 'mean'],
-            'Utilidad': ['sum', 'mean']
-        }).round(2)
-        
-        st.dataframe(resumen_categoria, use_container_width=True)
-    else:
-        st.info("No hay datos de categorías disponibles.")
+@st.fragment
+def seccion_widgets_demo(registros_filtrados, exportar):
+    """Widgets de demostración y descarga de los datos filtrados.
 
-with tab3:
+    `exportar(formato)` genera el contenido del archivo; solo se llama al hacer clic en descargar.
+    """
     st.markdown("#### 🎛️ Demostración de Widgets Adicionales")
     
     col_widget1, col_widget2 = st.columns(2)
     
     with col_widget1:
         # WIDGET: Text input
-        nombre_reporte = st.text_input("Nombre del reporte", value="Reporte Mensual")
+        st.text_input("Nombre del reporte", value="Reporte Mensual")
         
         # WIDGET: Text area
-        comentarios = st.text_area("Comentarios del análisis", 
-                                  placeholder="Escribe tus observaciones aquí...")
+        st.text_area("Comentarios del análisis", 
+                     placeholder="Escribe tus observaciones aquí...")
         
         # WIDGET: Time input
-        hora_reporte = st.time_input("Hora de generación del reporte")
+        st.time_input("Hora de generación del reporte")
         
         # WIDGET: Color picker (limitado a escala de grises)
-        color_personalizado = st.color_picker("Tono de gris personalizado", "#808080")
+        st.color_picker("Tono de gris personalizado", "#808080")
     
     with col_widget2:
         # WIDGET: Select slider con ratings
-        rating = st.select_slider(
+        st.select_slider(
             "Califica el desempeño",
             options=['Muy Malo', 'Malo', 'Regular', 'Bueno', 'Excelente'],
             value='Bueno'
         )
         
         # WIDGET: Range slider
-        rango_utilidad = st.slider(
+        st.slider(
             "Rango de utilidad esperada",
             min_value=-10000,
             max_value=50000,
@@ -1107,26 +2288,50 @@ with tab3:
         )
         
         # WIDGET: Toggle
-        notificaciones = st.toggle("Activar notificaciones")
+        st.toggle("Activar notificaciones")
         
         # WIDGET: Botones
         col_btn1, col_btn2 = st.columns(2)
         with col_btn1:
             if st.button("🔄 Actualizar datos", type="primary"):
                 st.success("Datos actualizados!")
-                st.rerun()
+                # Actualizar los datos requiere ejecutar todo el dashboard, no solo el fragmento
+                st.rerun(scope="app")
         
         with col_btn2:
-            # WIDGET: Download button para datos filtrados
-            if not df_filtrado.empty:
-                csv_data = df_filtrado.to_csv(index=False)
+            # WIDGET: Download button para datos filtrados (el archivo se genera solo al hacer clic)
+            if registros_filtrados > 0:
+                formato_exportacion = st.selectbox("Formato de descarga", list(FORMATOS_EXPORTACION))
+                extension, mime = FORMATOS_EXPORTACION[formato_exportacion]
+                excede_excel = formato_exportacion == 'Excel' and registros_filtrados > LIMITE_FILAS_EXCEL
+                if excede_excel:
+                    st.caption(f"⚠️ Excel admite hasta {LIMITE_FILAS_EXCEL:,} registros: usa CSV o Parquet")
                 st.download_button(
                     label="📥 Descargar datos",
-                    data=csv_data,
-                    file_name=f"datos_filtrados_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                    mime="text/csv"
+                    data=partial(perfilador.envolver('exportacion', exportar), formato_exportacion),
+                    file_name=f"datos_filtrados_{datetime.now().strftime('%Y%m%d_%H%M')}.{extension}",
+                    mime=mime,
+                    disabled=excede_excel
                 )
 
+with tab1, perfilador.etapa('tabla'):
+    seccion_tabla(df_base, posiciones_filtradas, clave_dataset, filtros, motor)
+
+with tab2, perfilador.etapa('resumen_categoria'):
+    if resumen_agrupado is not None and not resumen_agrupado.empty:
+        st.dataframe(resumen_agrupado, use_container_width=True)
+    elif df_filtrado is not None and not df_filtrado.empty and 'Categoria' in df_filtrado.columns:
+        st.dataframe(resumen_por_categoria(df_filtrado), use_container_width=True)
+    else:
+        st.info("No hay datos de categorías disponibles.")
+
+with tab3, perfilador.etapa('widgets_demo'):
+    if motor is not None:
+        exportar_filtrados = partial(generar_exportacion_duckdb, motor, filtros)
+    else:
+        exportar_filtrados = partial(generar_exportacion, df_base, posiciones_filtradas)
+    seccion_widgets_demo(totales['Registros'], exportar_filtrados)
+
 # --------------------
 # INFORMACIÓN ADICIONAL
 # --------------------
@@ -1168,4 +2373,64 @@ with st.expander("ℹ️ Información sobre widgets utilizados"):
     - Todos los degradados utilizan transiciones suaves entre tonos de la escala de grises
     - Efectos hover y sombras para mayor sofisticación visual
     - Tipografía mejorada con pesos y espaciados elegantes
-    """)
\ No newline at end of file
+    """)
+
+# --------------------
+# PERFILADO DEL RERUN
+# --------------------
+# Al final del script para incluir todas las etapas; en los reruns de un fragmento solo se
+# ejecuta su sección, así que el desglose corresponde al último rerun completo.
+with st.sidebar.expander("⏱️ Perfilado", expanded=perfilador.activo):
+    # WIDGETS: Activación del perfilado, medición de memoria y log JSONL
+    st.toggle(
+        "Medir etapas del rerun",
+        key='perfilado_activo',
+        help="Mide el tiempo de carga, filtros, agregaciones, métricas, gráficos, tablas y exportaciones"
+    )
+    st.checkbox(
+        "Medir memoria (más lento)",
+        key='perfilado_memoria',
+        help="Usa tracemalloc: incluye las asignaciones de todo el servidor y ralentiza el código Python"
+    )
+    st.checkbox(
+        f"Guardar en {RUTA_LOG_PERFILADO}",
+        key='perfilado_log',
+        help="Agrega una línea JSON por rerun (y por exportación) para analizarlas después"
+    )
+    if perfilador.activo:
+        st.dataframe(perfilador.resumen(), hide_index=True, use_container_width=True)
+        st.caption(f"Total del rerun: {perfilador.total():.3f} s")
+
+# --------------------
+# ADMINISTRACIÓN DEL SERVIDOR
+# --------------------
+# Solo con DASHBOARD_VISTA_ADMIN=1: muestra los datasets de todas las sesiones
+if os.environ.get('DASHBOARD_VISTA_ADMIN') == '1':
+    with st.sidebar.expander("🗄️ Datasets en memoria"):
+        estado_registro = registro_datasets.estadisticas()
+        st.metric(
+            "Memoria usada",
+            f"{estado_registro['bytes'] / 1024 ** 2:,.1f} MB",
+            help=f"Presupuesto: {estado_registro['max_bytes'] / 1024 ** 2:,.0f} MB (DASHBOARD_MEMORIA_DATASETS_MB)"
+        )
+        st.caption(
+            f"{estado_registro['entradas']} datasets y estructuras derivadas · {estado_registro['sesiones']} sesiones activas · "
+            f"{estado_registro['aciertos']} aciertos · {estado_registro['fallos']} fallos"
+        )
+        if estado_registro['bytes'] > estado_registro['max_bytes']:
+            st.warning("⚠️ Los datasets en uso superan el presupuesto de memoria")
+        st.dataframe(
+            pd.DataFrame(registro_datasets.inventario(), columns=['dataset', 'MB', 'sesiones', 'cargado', 'último uso']),
+            hide_index=True,
+            use_container_width=True
+        )
+        # WIDGET: Liberar los datasets que ninguna sesión usa
+        if st.button("🧹 Liberar datasets sin sesiones"):
+            st.toast(f"{registro_datasets.liberar_sin_uso()} datasets liberados")
+            st.rerun()
+
+perfilador.guardar_log(
+    dataset=clave_dataset,
+    registros_filtrados=totales['Registros'],
+    motor=motor_consultas
+)